@@ -0,0 +1,168 @@
+"""Per-client rate limiting and priority-aware load shedding.
+
+Every HTTP request falls into a route class:
+- checkout: POST /orders
+- auth: POST /auth/* (bcrypt-heavy)
+- write: any other non-GET request, except POST /batch
+- read: everything else; a batch costs one read per sub-request
+
+Each class has its own token bucket per client. A client is the signed-in
+user when the request carries a valid bearer token, and otherwise the peer
+address. Run uvicorn with --proxy-headers behind a proxy so that is the real
+client. A client over its budget gets a 429 with Retry-After.
+
+The process sheds load when too many requests are in flight, or when the
+median latency of recent SQL statements (which includes waits for SQLite's
+write lock) is high; see metrics for which statements are sampled. Lower
+priority classes go first: read and auth at the configured limits, writes at
+1.5x, and checkout only at 2x. Shed requests get a fast 503 with Retry-After.
+"""
+import hashlib
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.auth import decode_token, principal_cache
+from app.metrics import registry
+
+CHECKOUT = "checkout"
+AUTH = "auth"
+WRITE = "write"
+READ = "read"
+
+# (tokens per second, burst); override with GREENMART_RATE_LIMIT_<CLASS>=<rate>/<burst>, e.g. "20/60"
+_RATE_LIMIT_DEFAULTS = {
+    READ: "20/60",
+    WRITE: "5/20",
+    AUTH: "0.2/10",
+    CHECKOUT: "1/5",
+}
+RATE_LIMITING = os.environ.get("GREENMART_RATE_LIMIT", "1") == "1"
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    name: tuple(float(v) for v in os.environ.get(f"GREENMART_RATE_LIMIT_{name.upper()}", default).split("/"))
+    for name, default in _RATE_LIMIT_DEFAULTS.items()
+}
+RATE_LIMIT_CLIENTS = 100_000  # buckets kept per class; the least recently seen are dropped
+
+# 0 disables the check
+SHED_MAX_IN_FLIGHT = int(os.environ.get("GREENMART_SHED_MAX_IN_FLIGHT", "200"))
+SHED_DB_LATENCY = float(os.environ.get("GREENMART_SHED_DB_LATENCY_MS", "250")) / 1000
+# multiple of the limits above at which each class is shed
+SHED_FACTORS = {READ: 1.0, AUTH: 1.0, WRITE: 1.5, CHECKOUT: 2.0}
+
+EXEMPT_PATHS = frozenset({"/metrics"})
+
+
+def route_class(method: str, path: str) -> str:
+    if method == "POST" and path.rstrip("/") == "/orders":
+        return CHECKOUT
+    if method == "POST" and path.startswith("/auth/"):
+        return AUTH
+    if method == "POST" and path.rstrip("/") == "/batch":
+        return READ  # its other sub-requests are charged by the endpoint
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return READ
+    return WRITE
+
+
+class TokenBuckets:
+    """Token buckets for one route class, keyed by client."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, client: str, cost: float = 1, now: Optional[float] = None) -> float:
+        """Spend `cost` tokens; returns 0, or the seconds until they are available."""
+        cost = min(cost, self.burst)
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+
+buckets = {name: TokenBuckets(*limit) for name, limit in RATE_LIMITS.items()}
+
+
+def client_key(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                user_id = _token_user(token)
+                if user_id is not None:
+                    return f"user:{user_id}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+def _token_user(token: str) -> Optional[int]:
+    principal = principal_cache.get(hashlib.sha256(token.encode()).digest())
+    if principal is not None:
+        return principal.id
+    payload = decode_token(token)
+    return payload.get("sub") if payload else None
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+
+    def overload(self) -> float:
+        """Current load as a multiple of the shedding limits (>= 1 means overloaded)."""
+        load = 0.0
+        if SHED_MAX_IN_FLIGHT:
+            load = self.in_flight / SHED_MAX_IN_FLIGHT
+        if SHED_DB_LATENCY:
+            load = max(load, registry.recent_query_seconds() / SHED_DB_LATENCY)
+        return load
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        cls = route_class(scope["method"], scope["path"])
+        if self.overload() >= SHED_FACTORS[cls]:
+            await _reject(send, 503, "Server busy, please retry", 1)
+            return
+        if RATE_LIMITING:
+            wait = buckets[cls].take(client_key(scope))
+            if wait:
+                await _reject(send, 429, "Too many requests", wait)
+                return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,32 +1,123 @@
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Optional
-import bcrypt
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app import hashing
+from app.cache import PrincipalCache
 from app.database import get_db
 from app.models import User
+from app.offload import OffloadUnavailable, ProcessOffloader
 
 SECRET_KEY = "greenmart-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# bcrypt work factor for new hashes; stored hashes with a different cost are
+# rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.environ.get("GREENMART_BCRYPT_ROUNDS", "12"))
+# bcrypt runs in a process pool so login bursts can't starve the request threads
+HASH_WORKERS = int(os.environ.get("GREENMART_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_SIZE = int(os.environ.get("GREENMART_HASH_QUEUE_SIZE", "64"))
+
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_CACHE_TTL = 60  # seconds
+
 security = HTTPBearer(auto_error=False)
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers, detached from any session."""
+
+    id: int
+    email: str
+    full_name: str
+    role: str
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=user.is_active,
+        )
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+# Set by POST /batch to the (principal,) it resolved: its sub-requests carry
+# the same credentials, so they skip resolving them again.
+batch_principal: ContextVar[Optional[Tuple[Optional[Principal]]]] = ContextVar("batch_principal", default=None)
+_STALE_PRINCIPALS = "stale_principals"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stale_principals(session, flush_context):
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        attrs = inspect(obj).attrs
+        if obj in session.deleted or attrs.role.history.has_changes() or attrs.is_active.history.has_changes():
+            session.info.setdefault(_STALE_PRINCIPALS, set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_stale_principals(session):
+    for user_id in session.info.pop(_STALE_PRINCIPALS, ()):
+        principal_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_principals(session):
+    session.info.pop(_STALE_PRINCIPALS, None)
+
+
+hash_pool = ProcessOffloader(
+    max_workers=HASH_WORKERS, max_concurrency=HASH_WORKERS, max_queue=HASH_QUEUE_SIZE
+)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode("utf-8"),
-        hashed_password.encode("utf-8") if isinstance(hashed_password, str) else hashed_password,
-    )
+    return hashing.check_password(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    # bcrypt has 72-byte limit; truncate longer passwords
-    pw_bytes = password.encode("utf-8")[:72]
-    return bcrypt.hashpw(pw_bytes, bcrypt.gensalt()).decode("utf-8")
+    return hashing.hash_password(password, BCRYPT_ROUNDS)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return hashing.hash_rounds(hashed_password) != BCRYPT_ROUNDS
+
+
+async def _run_hashing(fn, *args):
+    try:
+        return await hash_pool.run(fn, *args)
+    except OffloadUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sign-in is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(hashing.check_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hashing(hashing.hash_password, password, BCRYPT_ROUNDS)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -44,16 +135,24 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
 
 def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: Session = Depends(get_db),
-) -> Optional[User]:
+) -> Optional[Principal]:
+    resolved = batch_principal.get()
+    if resolved is not None:
+        return resolved[0]
     if not credentials:
         return None
+    key = hashlib.sha256(credentials.credentials.encode()).digest()
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
     payload = decode_token(credentials.credentials)
     if not payload:
         return None
@@ -63,10 +162,15 @@ def get_current_user(
     user = db.query(User).filter(User.id == int(user_id)).first()
     if not user or not user.is_active:
         return None
-    return user
+    principal = Principal.from_user(user)
+    # never serve a cached principal past its token's expiry
+    ttl = min(PRINCIPAL_CACHE_TTL, payload["exp"] - time.time())
+    if ttl > 0:
+        principal_cache.put(key, principal, ttl)
+    return principal
 
 
-def require_user(user: Optional[User] = Depends(get_current_user)) -> User:
+def require_user(user: Optional[Principal] = Depends(get_current_user)) -> Principal:
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,7 +180,7 @@ def require_user(user: Optional[User] = Depends(get_current_user)) -> User:
     return user
 
 
-def require_seller(user: User = Depends(require_user)) -> User:
+def require_seller(user: Principal = Depends(require_user)) -> Principal:
     if user.role != "seller":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,231 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+CATALOG_CACHE_SIZE = 1024
+CATALOG_CACHE_TTL = 300  # seconds
+
+CATEGORIES_TAG = "categories"
+PRODUCT_LISTINGS_TAG = "products"
+# product columns that decide which listings (or search results) a product
+# appears in, and so the facet counts served with them
+LISTING_COLUMNS = frozenset({"category_id", "name", "description", "price", "stock"})
+
+
+def product_tag(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self._on_evict(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._insert(key, value, ttl)
+
+    def _insert(self, key: Hashable, value: Any, ttl: Optional[float]) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            old_key, _ = self._data.popitem(last=False)
+            self._on_evict(old_key)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._on_evict(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._on_clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # hooks for subclasses; called with the lock held
+    def _on_evict(self, key: Hashable) -> None:
+        pass
+
+    def _on_clear(self) -> None:
+        pass
+
+
+class PrincipalCache(TTLCache):
+    """TTL cache of authenticated principals keyed by token, evictable per user."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._by_user: Dict[int, set] = {}
+        self._key_user: Dict[Hashable, int] = {}
+
+    def put(self, key: Hashable, principal: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._on_evict(key)
+            self._insert(key, principal, ttl)
+            if key in self._data:
+                self._key_user[key] = principal.id
+                self._by_user.setdefault(principal.id, set()).add(key)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._data.pop(key, None)
+                self._key_user.pop(key, None)
+
+    def _on_evict(self, key: Hashable) -> None:
+        user_id = self._key_user.pop(key, None)
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def _on_clear(self) -> None:
+        self._by_user.clear()
+        self._key_user.clear()
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, headers: Dict[str, str]):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.headers = headers
+
+    def to_response(self, request: Request) -> Response:
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or any(t.removeprefix("W/") == etag for t in candidates)
+
+
+class ResponseCache(TTLCache):
+    """Serialized GET responses keyed by path and query, invalidated by tag.
+
+    Handlers call lookup() first and store() with the tags the body depends on;
+    write paths call invalidate() with the same tags after committing. A
+    generation counter keeps a response computed before an invalidation from
+    being stored after it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._tags: Dict[str, set] = {}
+        self._key_tags: Dict[Hashable, tuple] = {}
+        self.generation = 0
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Serve every request uncached: lookups miss and store() keeps nothing."""
+        self.enabled = False
+        self.clear()
+
+    @staticmethod
+    def _key(request: Request) -> tuple:
+        return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+    def lookup(self, request: Request) -> Optional[Response]:
+        request.state.cache_generation = self.generation
+        if not self.enabled:
+            return None
+        cached = self.get(self._key(request))
+        return cached.to_response(request) if cached is not None else None
+
+    def store(
+        self,
+        request: Request,
+        content: Any,
+        adapter: TypeAdapter,
+        response: Optional[Response] = None,
+        tags: Iterable[str] = (),
+    ) -> Response:
+        """Serialize content (or take the body of a ready Response) and cache it."""
+        if isinstance(content, Response):
+            body = bytes(content.body)
+            headers = {k: v for k, v in content.headers.items() if k.startswith("x-")}
+        else:
+            body = adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+            headers = {k: v for k, v in response.headers.items() if k.startswith("x-")} if response else {}
+        cached = CachedResponse(body, headers)
+        if not self.enabled:
+            return cached.to_response(request)
+        key = self._key(request)
+        with self._lock:
+            if getattr(request.state, "cache_generation", None) == self.generation:
+                self._on_evict(key)
+                self._insert(key, cached, None)
+                self._key_tags[key] = tuple(tags)
+                for tag in self._key_tags[key]:
+                    self._tags.setdefault(tag, set()).add(key)
+        return cached.to_response(request)
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if self._data.pop(key, None) is not None:
+                        self._on_evict(key)
+
+    def _on_evict(self, key: Hashable) -> None:
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _on_clear(self) -> None:
+        self._tags.clear()
+        self._key_tags.clear()
+        self.generation += 1
+
+
+catalog_cache = ResponseCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+
+def invalidate_products(product_ids: Iterable[int], listings: bool = False) -> None:
+    """Drop cached responses containing these products.
+
+    Pass listings=True when the change can alter which products a listing
+    returns, or its facet counts (a create or delete, or an update to a
+    column listings filter on).
+    """
+    tags = [product_tag(pid) for pid in product_ids]
+    if listings:
+        tags.append(PRODUCT_LISTINGS_TAG)
+    catalog_cache.invalidate(*tags)
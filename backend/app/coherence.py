@@ -0,0 +1,132 @@
+"""Keeps each worker process's in-memory caches coherent with writes made by the others.
+
+Triggers (migration 9) append a cache tag to the cache_invalidations table in
+the same transaction as any write that makes cached data stale: a product's
+tag when it changes, the listings tag when products are added or their
+name/description/category change, the categories tag, and user:<id> when a
+user's role or active flag changes. Before a request, at most once every
+CACHE_SYNC_INTERVAL, CacheSync asks its own SQLite connection for PRAGMA
+data_version, which only changes when another connection has committed; only
+then does it read the new log rows and invalidate the matching entries in
+catalog_cache and principal_cache. The check runs on the event loop, so it
+never waits for a lock: if the database is busy it is retried next time.
+
+The log is pruned after INVALIDATION_RETENTION, which is longer than any cache
+TTL. A process that has not synced for that long clears its caches instead.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.auth import principal_cache
+from app.cache import catalog_cache
+from app.database import DATABASE_PATH
+from app.models import CacheInvalidation
+
+logger = logging.getLogger("greenmart.cache")
+
+CACHE_SYNC = os.environ.get("GREENMART_CACHE_SYNC", "1") == "1"
+CACHE_SYNC_INTERVAL = float(os.environ.get("GREENMART_CACHE_SYNC_INTERVAL_MS", "50")) / 1000
+INVALIDATION_RETENTION = timedelta(hours=1)
+USER_TAG_PREFIX = "user:"
+
+
+class CacheSync:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._checked_at = float("-inf")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 0")
+        return conn
+
+    def poll(self) -> None:
+        """sync(), unless it already ran within the last CACHE_SYNC_INTERVAL."""
+        now = time.monotonic()
+        if now - self._checked_at < CACHE_SYNC_INTERVAL:
+            return
+        self._checked_at = now
+        self.sync()
+
+    def sync(self) -> None:
+        """Apply invalidations committed by other processes since the last call."""
+        with self._lock:
+            synced_at = self._synced_at
+            try:
+                self._sync()
+            except sqlite3.Error as e:
+                if getattr(e, "sqlite_errorcode", None) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+                    # nothing was applied, so the next check starts from the same place
+                    self._data_version = None
+                    self._synced_at = synced_at
+                    return
+                logger.exception("cache sync failed; clearing caches")
+                self._conn = None
+                _clear_all()
+
+    def _sync(self) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+            self._data_version = None
+        now = time.monotonic()
+        stale = now - self._synced_at > INVALIDATION_RETENTION.total_seconds()
+        self._synced_at = now
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and not stale:
+            return
+        self._data_version = data_version
+        if stale:
+            # entries older than the log were pruned from it; start over from the current end
+            self._last_id = self._conn.execute("SELECT coalesce(max(id), 0) FROM cache_invalidations").fetchone()[0]
+            _clear_all()
+            return
+        rows = self._conn.execute(
+            "SELECT id, tag FROM cache_invalidations WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        self._last_id = rows[-1][0]
+        tags = {tag for _, tag in rows}
+        catalog_cache.invalidate(*(tag for tag in tags if not tag.startswith(USER_TAG_PREFIX)))
+        for tag in tags:
+            if tag.startswith(USER_TAG_PREFIX):
+                principal_cache.invalidate_user(int(tag[len(USER_TAG_PREFIX):]))
+
+
+def _clear_all() -> None:
+    catalog_cache.clear()
+    principal_cache.clear()
+
+
+cache_sync = CacheSync(DATABASE_PATH)
+
+
+class CacheSyncMiddleware:
+    """Polls cache_sync before every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and CACHE_SYNC:
+            cache_sync.poll()
+        await self.app(scope, receive, send)
+
+
+def purge_invalidations(db: Session) -> None:
+    db.execute(delete(CacheInvalidation).where(
+        CacheInvalidation.created_at < datetime.utcnow() - INVALIDATION_RETENTION
+    ))
+    db.commit()
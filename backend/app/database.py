@@ -1,23 +1,128 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+from urllib.parse import quote
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'greenmart.db')}"
+DATABASE_PATH = os.environ.get("GREENMART_DB_PATH", os.path.join(BASE_DIR, "greenmart.db"))
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# Applied to every new connection. Each can be overridden with
+# GREENMART_SQLITE_<NAME>, e.g. GREENMART_SQLITE_JOURNAL_MODE=DELETE.
+_SQLITE_PRAGMA_DEFAULTS = {
+    "journal_mode": "WAL",  # readers don't block behind the writer
+    "synchronous": "NORMAL",  # durable at checkpoint; safe with WAL
+    "busy_timeout": 5000,  # ms to wait for the write lock before "database is locked"
+    "cache_size": -64000,  # negative = KiB, so 64 MB of page cache per connection
+    "mmap_size": 268435456,  # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+}
+SQLITE_PRAGMAS = {
+    name: os.environ.get(f"GREENMART_SQLITE_{name.upper()}", default)
+    for name, default in _SQLITE_PRAGMA_DEFAULTS.items()
+}
+
+# Reads routed through get_read_db/get_async_read_db use their own read-only
+# connections (mode=ro plus query_only), by default to the primary file. Point
+# GREENMART_READ_DB_PATH at a replica (e.g. a LiteFS or Litestream copy) to
+# move them off it; reads may then lag writes by the replication delay.
+READ_DATABASE_PATH = os.environ.get("GREENMART_READ_DB_PATH", DATABASE_PATH)
+_read_uri = f"file:{quote(READ_DATABASE_PATH)}?mode=ro&uri=true"
+READ_DATABASE_URL = f"sqlite:///{_read_uri}"
+ASYNC_READ_DATABASE_URL = f"sqlite+aiosqlite:///{_read_uri}"
+
+# Connections are budgeted across all uvicorn workers, each getting an equal
+# share with overflow counted inside it. Of a worker's share, the sync and
+# async read-write pools hold up to DB_WRITE_POOL_SIZE each (by default an
+# eighth of the share, at least 4), one goes to the cache-sync connection, and
+# the sync and async read-only pools split the rest: up to DB_POOL_SIZE each,
+# half kept open and half as overflow for bursts. So a worker never opens more
+# than 2 * DB_WRITE_POOL_SIZE + 2 * DB_POOL_SIZE + 1 connections (63 by default).
+#
+# SQLite runs one write transaction at a time, so more write connections only
+# mean more writers waiting on busy_timeout inside SQLite. Sync write handlers
+# beyond the pool size queue on the event loop (see get_write_db); an async
+# writer that waits DB_POOL_TIMEOUT for a connection gets a 503 (see main).
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+DB_MAX_CONNECTIONS = int(os.environ.get("GREENMART_DB_MAX_CONNECTIONS", "64"))
+_worker_connections = DB_MAX_CONNECTIONS // max(1, WEB_CONCURRENCY)
+DB_WRITE_POOL_SIZE = int(os.environ.get("GREENMART_DB_WRITE_POOL_SIZE", str(max(4, _worker_connections // 8))))
+DB_POOL_SIZE = max(2, (_worker_connections - 2 * DB_WRITE_POOL_SIZE - 1) // 2)
+DB_POOL_TIMEOUT = float(os.environ.get("GREENMART_DB_POOL_TIMEOUT", "10"))
+
+# Serialize write transactions in-process instead of letting them contend for
+# SQLite's single write lock. Writers queue on the event loop, so one waiting
+# for its turn holds neither a worker thread nor a connection.
+SERIALIZE_WRITES = os.environ.get("GREENMART_DB_SERIALIZE_WRITES", "0") == "1"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+_write_pool_args = dict(pool_size=DB_WRITE_POOL_SIZE, max_overflow=0, pool_timeout=DB_POOL_TIMEOUT)
+_read_pool_args = dict(
+    pool_size=DB_POOL_SIZE - DB_POOL_SIZE // 2, max_overflow=DB_POOL_SIZE // 2, pool_timeout=DB_POOL_TIMEOUT
+)
+
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, **_write_pool_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# aiosqlite defaults to NullPool, which would start a new connection thread per session
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, **_write_pool_args)
+# expire_on_commit=False: attributes can't be lazily refreshed on an AsyncSession
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+read_engine = create_engine(READ_DATABASE_URL, connect_args={"check_same_thread": False}, **_read_pool_args)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+async_read_engine = create_async_engine(
+    ASYNC_READ_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, **_read_pool_args
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
-def _migrate_add_seller_id():
-    """Add seller_id to products table if it doesn't exist."""
-    with engine.connect() as conn:
-        r = conn.execute(text("PRAGMA table_info(products)"))
-        cols = [row[1] for row in r]
-        if "seller_id" not in cols:
-            conn.execute(text("ALTER TABLE products ADD COLUMN seller_id INTEGER REFERENCES users(id)"))
-            conn.commit()
+
+@event.listens_for(read_engine, "connect")
+@event.listens_for(async_read_engine.sync_engine, "connect")
+def _apply_read_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        if name != "journal_mode":  # a property of the file, set by the writer
+            cursor.execute(f"PRAGMA {name}={value}")
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+_write_queue = asyncio.Lock()
+# Sync handlers with a write session, at most one per connection of the sync write
+# pool: the rest wait here on the event loop instead of in worker threads.
+_sync_write_slots = asyncio.Semaphore(DB_WRITE_POOL_SIZE)
+
+
+@asynccontextmanager
+async def serialized_write():
+    """Hold the process-wide write queue around a commit when SERIALIZE_WRITES is on."""
+    if not SERIALIZE_WRITES:
+        yield
+        return
+    async with _write_queue:
+        yield
 
 
 def get_db():
@@ -28,6 +133,58 @@ def get_db():
         db.close()
 
 
+# Set by POST /batch: its sub-requests share one read session (and so one
+# snapshot) of each kind instead of opening their own.
+batch_read_db: ContextVar[Optional[Session]] = ContextVar("batch_read_db", default=None)
+batch_async_read_db: ContextVar[Optional[AsyncSession]] = ContextVar("batch_async_read_db", default=None)
+
+
+def get_read_db():
+    shared = batch_read_db.get()
+    if shared is not None:
+        yield shared
+        return
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_write_db():
+    """Sync session for a sync handler, admitted on the event loop. Handlers
+    blocked in worker threads on the write queue (with SERIALIZE_WRITES) or on
+    a pooled connection could take every threadpool token, leaving none for
+    the writer they wait on to finish and serialize its response."""
+    async with serialized_write(), _sync_write_slots:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()  # returns the connection to the pool; quick, the handler has committed
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    shared = batch_async_read_db.get()
+    if shared is not None:
+        yield shared
+        return
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def get_async_write_db():
+    async with serialized_write():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    _migrate_add_seller_id()
+    from app.migrations import run_migrations
+
+    run_migrations(engine)
@@ -0,0 +1,20 @@
+"""bcrypt primitives. Kept free of app imports so pool worker processes start quickly."""
+import bcrypt
+
+
+def hash_password(password: str, rounds: int) -> str:
+    # bcrypt has 72-byte limit; truncate longer passwords
+    pw_bytes = password.encode("utf-8")[:72]
+    return bcrypt.hashpw(pw_bytes, bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8"),
+        hashed_password.encode("utf-8") if isinstance(hashed_password, str) else hashed_password,
+    )
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Work factor of a stored hash, e.g. 12 for "$2b$12$..."."""
+    return int(hashed_password.split("$")[2])
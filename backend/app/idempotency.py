@@ -0,0 +1,70 @@
+"""Idempotency-Key support for non-idempotent POSTs.
+
+The first successful response for a key is stored in the same transaction as
+the work it reports, so a retry either finds that response and replays it, or
+finds nothing because the original never committed and safely runs again.
+Two concurrent requests with one key race on the primary key: the loser's
+transaction fails and it replays the winner's response.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL = timedelta(hours=float(os.environ.get("GREENMART_IDEMPOTENCY_TTL_HOURS", "24")))
+
+
+def fingerprint(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+async def replay(db: AsyncSession, key: str, request_fingerprint: str) -> Optional[Response]:
+    """The stored response for key, or None if the key is new or expired."""
+    record = await db.get(IdempotencyKey, key, populate_existing=True)
+    if record is None or record.created_at < datetime.utcnow() - IDEMPOTENCY_TTL:
+        return None
+    if record.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{IDEMPOTENCY_HEADER} was already used with a different request",
+        )
+    return Response(
+        content=record.body,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+
+async def remember(db: AsyncSession, key: str, request_fingerprint: str, status_code: int, body: bytes) -> None:
+    """Record the response for key in the current transaction, replacing an expired one.
+
+    Raises IntegrityError if a live record for key was committed meanwhile.
+    """
+    now = datetime.utcnow()
+    await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.created_at < now - IDEMPOTENCY_TTL)
+    )
+    await db.execute(insert(IdempotencyKey).values(
+        key=key,
+        fingerprint=request_fingerprint,
+        status_code=status_code,
+        body=body.decode(),
+        created_at=now,
+    ))
+
+
+def purge_expired(db: Session) -> int:
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < datetime.utcnow() - IDEMPOTENCY_TTL))
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,78 @@
+"""Locally stored product images.
+
+Uploads are stored content-addressed (named by their sha256) with a JPEG
+thumbnail made once in a process pool. Since a URL's bytes can never change,
+files are served with a one-year immutable Cache-Control.
+"""
+import os
+
+from fastapi import HTTPException, status
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+from app import imaging
+from app.offload import OffloadUnavailable, ProcessOffloader
+
+IMAGE_DIR = os.environ.get(
+    "GREENMART_IMAGE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "media", "images"),
+)
+IMAGE_URL_PREFIX = "/images"
+MAX_IMAGE_BYTES = int(os.environ.get("GREENMART_MAX_IMAGE_MB", "5")) * 1024 * 1024
+THUMBNAIL_SIZE = int(os.environ.get("GREENMART_THUMBNAIL_SIZE", "400"))  # longest side, px
+IMAGE_WORKERS = int(os.environ.get("GREENMART_IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_SIZE = int(os.environ.get("GREENMART_IMAGE_QUEUE_SIZE", "16"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+image_pool = ProcessOffloader(
+    max_workers=IMAGE_WORKERS, max_concurrency=IMAGE_WORKERS, max_queue=IMAGE_QUEUE_SIZE
+)
+
+
+def image_url(path: str) -> str:
+    return f"{IMAGE_URL_PREFIX}/{path}"
+
+
+async def store_upload(data: bytes):
+    """Validate and store an uploaded image; returns (image URL, thumbnail URL or None)."""
+    ext = imaging.sniff(data)
+    if ext is None:
+        raise HTTPException(status_code=415, detail="Upload a JPEG, PNG, GIF or WebP image")
+    try:
+        original, thumbnail = await image_pool.run(imaging.store_image, data, ext, IMAGE_DIR, THUMBNAIL_SIZE)
+    except OffloadUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return image_url(original), image_url(thumbnail) if thumbnail else None
+
+
+class _ImageFileResponse(FileResponse):
+    """FileResponse that hands whole-file bodies to the server when it can send them
+    itself (the ASGI "http.response.pathsend" extension, e.g. sendfile), instead of
+    reading them through Python in chunks."""
+
+    async def __call__(self, scope, receive, send):
+        self._pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send, send_header_only: bool) -> None:
+        if not self._pathsend or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": str(self.path)})
+
+
+class ImageFiles(StaticFiles):
+    """Static files for IMAGE_DIR with far-future caching (content-addressed names)."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if isinstance(response, FileResponse):
+            response = _ImageFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
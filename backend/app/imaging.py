@@ -0,0 +1,84 @@
+"""Image storage and thumbnailing. Kept free of app imports so pool worker processes start quickly."""
+import hashlib
+import io
+import os
+import tempfile
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+THUMBNAIL_QUALITY = 85
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+def sniff(data: bytes) -> Optional[str]:
+    """File extension for a supported image format, judged by its magic bytes."""
+    for signature, ext in _SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _write_once(path: str, data: bytes) -> None:
+    """Atomically create path; content-addressed, so an existing file already has these bytes."""
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _thumbnail(data: bytes, size: int) -> bytes:
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((size, size))
+            if im.mode in ("RGBA", "LA", "P"):
+                im = im.convert("RGBA")
+                flat = Image.new("RGB", im.size, "white")
+                flat.paste(im, mask=im.getchannel("A"))
+                im = flat
+            elif im.mode != "RGB":
+                im = im.convert("RGB")
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            return out.getvalue()
+    except Exception as e:  # corrupt data, decompression bombs, unsupported variants
+        raise ValueError(f"Could not read image: {e}") from None
+
+
+def store_image(data: bytes, ext: str, directory: str, thumbnail_size: int) -> Tuple[str, Optional[str]]:
+    """Store data under its sha256 (once) plus a JPEG thumbnail; return both paths relative to directory.
+
+    The thumbnail path is None when Pillow is not installed. Raises ValueError
+    for data Pillow cannot decode.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{digest[:2]}/{digest}"
+    thumbnail = None
+    if Image is not None:
+        thumbnail = f"{name}_{thumbnail_size}.jpg"
+        path = os.path.join(directory, thumbnail)
+        if not os.path.exists(path):
+            # decode before storing anything, so undecodable uploads leave no files behind
+            _write_once(path, _thumbnail(data, thumbnail_size))
+    original = f"{name}.{ext}"
+    _write_once(os.path.join(directory, original), data)
+    return original, thumbnail
@@ -0,0 +1,258 @@
+"""Durable in-process background jobs.
+
+Jobs are rows in the jobs table, added with enqueue() in the same transaction
+as the work that causes them: a committed order always has its follow-up work
+recorded, and a rolled-back one never does. Every app process runs a JobQueue
+(started from main's startup hook) that checks for due jobs with a plain
+read and only then claims them with one atomic UPDATE, runs up to
+GREENMART_JOB_WORKERS of them at a time on the event loop, and records the
+outcome. Failures are retried with exponential backoff until
+max_attempts, then kept as "failed".
+
+A claim is a lease: if a process dies mid-job the lease runs out and another
+dispatcher picks the job up again, so delivery is at-least-once and handlers
+must be idempotent.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database import AsyncSessionLocal, SessionLocal, serialized_write
+from app.models import Job
+
+logger = logging.getLogger("greenmart.jobs")
+
+JOB_WORKERS = int(os.environ.get("GREENMART_JOB_WORKERS", "4"))
+JOB_POLL_SECONDS = float(os.environ.get("GREENMART_JOB_POLL_SECONDS", "1"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("GREENMART_JOB_TIMEOUT_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("GREENMART_JOB_MAX_ATTEMPTS", "5"))
+JOB_RETENTION = timedelta(days=float(os.environ.get("GREENMART_JOB_RETENTION_DAYS", "7")))
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 600.0
+LEASE_MARGIN_SECONDS = 30.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+HANDLERS: Dict[str, Handler] = {}
+# (interval seconds, fn(Session)) housekeeping run by every dispatcher
+PERIODIC: List[Tuple[float, Callable[[Session], Any]]] = []
+
+_jobs = Job.__table__
+_WAKE = "wake_job_queue"
+
+
+def job_handler(kind: str):
+    def register(fn: Handler) -> Handler:
+        HANDLERS[kind] = fn
+        return fn
+
+    return register
+
+
+def periodic(seconds: float):
+    """Run a sync fn(db) every `seconds` in each process; it must tolerate running concurrently."""
+    def register(fn: Callable[[Session], Any]):
+        PERIODIC.append((seconds, fn))
+        return fn
+
+    return register
+
+
+def enqueue(db, kind: str, payload: Optional[Dict[str, Any]] = None, delay: float = 0,
+            max_attempts: int = JOB_MAX_ATTEMPTS) -> Job:
+    """Add a job to db's current transaction (sync or async session); it runs after commit."""
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status=QUEUED,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    db.info[_WAKE] = True
+    return job
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_WAKE, False):
+        job_queue.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_wake(session):
+    session.info.pop(_WAKE, None)
+
+
+def backoff(attempts: int) -> float:
+    """Seconds before retry number `attempts`, with jitter so failed batches spread out."""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    def __init__(self, workers: int, poll_seconds: float, timeout: float):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._next_periodic: Dict[Callable, float] = {}
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        now = time.monotonic()
+        self._next_periodic = {fn: now + seconds for seconds, fn in PERIODIC}
+        self._dispatcher = self._loop.create_task(self._dispatch())
+
+    async def stop(self, grace: float = 5.0) -> None:
+        """Stop claiming, give running jobs `grace` seconds, then cancel them (their leases lapse)."""
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        await asyncio.gather(self._dispatcher, return_exceptions=True)
+        self._dispatcher = None
+        if self._running:
+            _, pending = await asyncio.wait(self._running, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def wake(self) -> None:
+        """Check for due jobs now instead of at the next poll; safe from any thread."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._run_periodic()
+                free = self.workers - len(self._running)
+                claimed = await self._claim(free) if free > 0 else []
+            except Exception:
+                logger.exception("job dispatcher failed; retrying after the poll interval")
+                claimed, free = [], 0
+            for job in claimed:
+                task = asyncio.create_task(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._job_finished)
+            if claimed and len(claimed) == free:
+                continue  # there may be more due work; claim again once a slot frees
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _job_finished(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._wakeup.set()
+
+    async def _claim(self, limit: int) -> list:
+        now = datetime.utcnow()
+        is_due = or_(
+            and_(_jobs.c.status == QUEUED, _jobs.c.run_at <= now),
+            and_(_jobs.c.status == RUNNING, _jobs.c.locked_until < now),
+        )
+        # most polls find nothing; check with a plain read so those never take the write lock
+        async with AsyncSessionLocal() as db:
+            if (await db.execute(select(_jobs.c.id).where(is_due).limit(1))).first() is None:
+                return []
+        due = select(_jobs.c.id).where(is_due).order_by(_jobs.c.run_at).limit(limit)
+        stmt = (
+            update(_jobs)
+            .where(_jobs.c.id.in_(due))
+            .values(
+                status=RUNNING,
+                attempts=_jobs.c.attempts + 1,
+                locked_until=now + timedelta(seconds=self.timeout + LEASE_MARGIN_SECONDS),
+            )
+            .returning(_jobs.c.id, _jobs.c.kind, _jobs.c.payload, _jobs.c.attempts, _jobs.c.max_attempts)
+        )
+        async with serialized_write():
+            async with AsyncSessionLocal() as db:
+                claimed = (await db.execute(stmt)).all()
+                await db.commit()
+        return claimed
+
+    async def _run(self, job) -> None:
+        handler = HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"no handler registered for job kind {job.kind!r}")
+            await asyncio.wait_for(handler(json.loads(job.payload)), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts >= job.max_attempts:
+                logger.error("job %d (%s) failed permanently after %d attempts: %s", job.id, job.kind, job.attempts, error)
+                values = {"status": FAILED, "finished_at": datetime.utcnow()}
+            else:
+                delay = backoff(job.attempts)
+                logger.warning("job %d (%s) attempt %d failed, retrying in %.1fs: %s",
+                               job.id, job.kind, job.attempts, delay, error)
+                values = {"status": QUEUED, "run_at": datetime.utcnow() + timedelta(seconds=delay)}
+            await self._finish(job, last_error=error, **values)
+        else:
+            await self._finish(job, status=DONE, finished_at=datetime.utcnow(), last_error=None)
+
+    async def _finish(self, job, **values) -> None:
+        # only if still ours: a job whose lease lapsed may have been re-claimed meanwhile
+        stmt = (
+            update(_jobs)
+            .where(_jobs.c.id == job.id, _jobs.c.status == RUNNING, _jobs.c.attempts == job.attempts)
+            .values(locked_until=None, **values)
+        )
+        try:
+            async with serialized_write():
+                async with AsyncSessionLocal() as db:
+                    await db.execute(stmt)
+                    await db.commit()
+        except Exception:
+            logger.exception("could not record the outcome of job %d; it will run again when its lease lapses", job.id)
+
+    async def _run_periodic(self) -> None:
+        now = time.monotonic()
+        for seconds, fn in PERIODIC:
+            if self._next_periodic.get(fn, now) > now:
+                continue
+            self._next_periodic[fn] = now + seconds
+            try:
+                async with serialized_write():
+                    await asyncio.to_thread(_call_with_session, fn)
+            except Exception:
+                logger.exception("periodic task %s failed", fn.__name__)
+
+
+def _call_with_session(fn: Callable[[Session], Any]) -> None:
+    db = SessionLocal()
+    try:
+        fn(db)
+    finally:
+        db.close()
+
+
+@periodic(3600)
+def purge_finished_jobs(db: Session) -> None:
+    db.execute(
+        delete(Job).where(Job.status.in_((DONE, FAILED)), Job.finished_at < datetime.utcnow() - JOB_RETENTION)
+    )
+    db.commit()
+
+
+job_queue = JobQueue(JOB_WORKERS, JOB_POLL_SECONDS, JOB_TIMEOUT_SECONDS)
@@ -1,18 +1,40 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeout
 
-from app.database import init_db
-from app.routers import products, categories, orders, admin, auth, seller
+from app.admission import AdmissionMiddleware
+from app.auth import hash_pool
+from app.coherence import CacheSyncMiddleware
+from app.database import async_engine, async_read_engine, engine, init_db, read_engine
+from app.idempotency import REPLAYED_HEADER
+from app.images import IMAGE_DIR, IMAGE_URL_PREFIX, ImageFiles, image_pool
+from app.jobs import job_queue
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app.pagination import NEXT_CURSOR_HEADER
+from app.routers import products, categories, orders, admin, auth, seller, batch
+from app import tasks  # noqa: F401  (registers job handlers and periodic tasks)
 
 app = FastAPI(title="Greenmart API", version="1.0.0")
 
+# only admitted requests read the caches, so only they pay for the sync check
+app.add_middleware(CacheSyncMiddleware)
+# inside CORS and metrics, so its 429/503 responses still get CORS headers and are counted
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REPLAYED_HEADER, "ETag", "Server-Timing", "Retry-After"],
 )
+app.add_middleware(MetricsMiddleware)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+instrument_engine(read_engine)
+instrument_engine(async_read_engine.sync_engine)
 
 app.include_router(products.router)
 app.include_router(categories.router)
@@ -20,13 +42,36 @@ app.include_router(orders.router)
 app.include_router(admin.router)
 app.include_router(auth.router)
 app.include_router(seller.router)
+app.include_router(batch.router)
+app.mount(IMAGE_URL_PREFIX, ImageFiles(directory=IMAGE_DIR, check_dir=False), name="images")
 
 
 @app.on_event("startup")
-def startup():
+async def startup():
     init_db()
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    hash_pool.shutdown()
+    image_pool.shutdown()
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout(request: Request, exc: PoolTimeout):
+    # every connection of a pool stayed busy for DB_POOL_TIMEOUT: overloaded, not broken
+    return JSONResponse(
+        status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"}
+    )
 
 
 @app.get("/")
 def root():
     return {"message": "Greenmart API", "docs": "/docs"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,276 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("greenmart.sql")
+
+SLOW_QUERY_SECONDS = float(os.environ.get("GREENMART_SLOW_QUERY_MS", "100")) / 1000
+SERVER_TIMING = os.environ.get("GREENMART_SERVER_TIMING", "0") == "1"
+
+# Load shedding looks at the median latency of statements run for ordinary
+# requests over the last QUERY_LATENCY_WINDOW seconds. A median ignores the
+# odd slow statement; with fewer than QUERY_LATENCY_MIN_SAMPLES statements in
+# the window the database is not busy and it reads as 0. Statements of bulk
+# requests (admin pages, exports, imports) and background work are left out.
+QUERY_LATENCY_WINDOW = 10
+QUERY_LATENCY_MIN_SAMPLES = 20
+UNSAMPLED_PATH_PREFIXES = ("/admin/",)
+UNSAMPLED_PATH_SUFFIXES = ("/export", "/import")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram for one label set."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class LatencyWindow:
+    """Latency quantiles over the last `seconds`, from one set of histogram counts per second."""
+
+    def __init__(self, seconds: int, buckets: Sequence[float]):
+        self.seconds = seconds
+        self.buckets = buckets
+        self._slots: Dict[int, list] = {}  # whole second -> counts per bucket, last is +Inf
+
+    def observe(self, value: float, now: float) -> None:
+        second = int(now)
+        counts = self._slots.get(second)
+        if counts is None:
+            for old in [s for s in self._slots if s <= second - self.seconds]:
+                del self._slots[old]
+            counts = self._slots[second] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+
+    def quantile(self, q: float, now: float, min_samples: int = 1) -> float:
+        """Estimated q-quantile, interpolated within its bucket; 0 with fewer than min_samples."""
+        first = int(now) - self.seconds + 1
+        totals = [0] * (len(self.buckets) + 1)
+        for second, counts in self._slots.items():
+            if second >= first:
+                totals = [t + c for t, c in zip(totals, counts)]
+        n = sum(totals)
+        if n < max(1, min_samples):
+            return 0.0
+        rank = q * n
+        cumulative, lower = 0, 0.0
+        for upper, count in zip(list(self.buckets) + [self.buckets[-1]], totals):
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return lower
+
+
+class RequestStats:
+    """Per-request SQL counters, shared with threadpool workers through a context var."""
+
+    __slots__ = ("queries", "db_time", "sample_latency")
+
+    def __init__(self, sample_latency: bool = True):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sample_latency = sample_latency  # feed the load-shedding latency window
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queries_per_request: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], float] = {}
+        self.responses: Dict[Tuple[str, str, str], int] = {}
+        self.queries_total = 0
+        self.slow_queries_total = 0
+        self._recent_queries = LatencyWindow(QUERY_LATENCY_WINDOW, LATENCY_BUCKETS)
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries_per_request.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.queries)
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+            rkey = (method, route, str(status))
+            self.responses[rkey] = self.responses.get(rkey, 0) + 1
+
+    def record_query(self, seconds: float, sample_latency: bool = True) -> None:
+        with self._lock:
+            self.queries_total += 1
+            if seconds >= SLOW_QUERY_SECONDS:
+                self.slow_queries_total += 1
+            if sample_latency:
+                self._recent_queries.observe(seconds, time.monotonic())
+
+    def recent_query_seconds(self) -> float:
+        """Median latency of recently sampled statements (including waits for
+        SQLite's write lock); 0 while too few statements have run."""
+        with self._lock:
+            return self._recent_query_seconds()
+
+    def _recent_query_seconds(self) -> float:
+        return self._recent_queries.quantile(0.5, time.monotonic(), QUERY_LATENCY_MIN_SAMPLES)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        out = []
+        with self._lock:
+            _render_histograms(
+                out, "greenmart_http_request_duration_seconds",
+                "Request latency by route.", self.latency,
+            )
+            _render_histograms(
+                out, "greenmart_db_queries_per_request",
+                "SQL statements executed per request.", self.queries_per_request,
+            )
+            out.append("# HELP greenmart_db_time_seconds_total Time spent in SQL statements by route.")
+            out.append("# TYPE greenmart_db_time_seconds_total counter")
+            for (method, route), seconds in sorted(self.db_time.items()):
+                out.append(f"greenmart_db_time_seconds_total{_labels(method=method, route=route)} {seconds:.6f}")
+            out.append("# HELP greenmart_http_responses_total Responses by route and status code.")
+            out.append("# TYPE greenmart_http_responses_total counter")
+            for (method, route, status), n in sorted(self.responses.items()):
+                out.append(f"greenmart_http_responses_total{_labels(method=method, route=route, status=status)} {n}")
+            out.append("# HELP greenmart_db_queries_total SQL statements executed.")
+            out.append("# TYPE greenmart_db_queries_total counter")
+            out.append(f"greenmart_db_queries_total {self.queries_total}")
+            out.append("# HELP greenmart_db_slow_queries_total SQL statements slower than the slow-query threshold.")
+            out.append("# TYPE greenmart_db_slow_queries_total counter")
+            out.append(f"greenmart_db_slow_queries_total {self.slow_queries_total}")
+            out.append("# HELP greenmart_db_recent_query_seconds Median recent SQL statement latency, as used for load shedding.")
+            out.append("# TYPE greenmart_db_recent_query_seconds gauge")
+            out.append(f"greenmart_db_recent_query_seconds {self._recent_query_seconds():.6f}")
+        return "\n".join(out) + "\n"
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _render_histograms(out: list, name: str, help_text: str, series: Dict[Tuple[str, str], Histogram]) -> None:
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} histogram")
+    for (method, route), h in sorted(series.items()):
+        cumulative = 0
+        for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+            cumulative += n
+            out.append(f"{name}_bucket{_labels(method=method, route=route, le=str(bound))} {cumulative}")
+        out.append(f"{name}_sum{_labels(method=method, route=route)} {h.sum:.6f}")
+        out.append(f"{name}_count{_labels(method=method, route=route)} {h.count}")
+
+
+registry = Registry()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count statements and time spent per request, and log slow ones."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _request_stats.get()
+        registry.record_query(elapsed, sample_latency=stats is not None and stats.sample_latency)
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+        if elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split()))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+def _route_label(scope) -> str:
+    """The matched route's path template, or a mounted app's mount path."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "app_root_path" in scope:
+        # a Mount matched and appended its path to the root_path it started from
+        return scope["root_path"][len(scope["app_root_path"]):] or UNMATCHED_ROUTE
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and SQL usage per route.
+
+    With GREENMART_SERVER_TIMING=1 it also adds a Server-Timing header
+    (app time and DB time/query count up to the first response byte).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        stats = RequestStats(
+            sample_latency=not (path.startswith(UNSAMPLED_PATH_PREFIXES) or path.endswith(UNSAMPLED_PATH_SUFFIXES))
+        )
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'app;dur={app_ms:.2f}, '
+                        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"'
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timing.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            registry.record_request(
+                scope["method"],
+                _route_label(scope),
+                status,
+                time.perf_counter() - started,
+                stats,
+            )
@@ -0,0 +1,257 @@
+"""Versioned schema migrations.
+
+The applied version lives in SQLite's PRAGMA user_version, so a database that
+is already current costs one header read at startup and no introspection.
+Pending migrations run in order inside a single BEGIN IMMEDIATE transaction,
+which also keeps concurrently starting workers from migrating twice. Workers
+that start while another one migrates wait up to MIGRATION_LOCK_TIMEOUT for
+it, rather than the usual busy_timeout, since a backfill can take minutes.
+
+Migrations must be idempotent: databases created before the runner existed
+start at version 0 but may already have some of the schema.
+"""
+import os
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import SQLITE_PRAGMAS, Base
+from app import models
+from app.rollups import rebuild_sales_analytics, rebuild_seller_sales
+
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = []
+MIGRATION_LOCK_TIMEOUT = float(os.environ.get("GREENMART_MIGRATION_LOCK_TIMEOUT_S", "600"))
+
+
+def migration(version: int):
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return register
+
+
+def _version(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(engine: Engine) -> int:
+    """Bring the schema up to date and return the resulting version."""
+    latest = MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        current = _version(conn)
+        if current >= latest:
+            return current
+        conn.exec_driver_sql(f"PRAGMA busy_timeout = {int(MIGRATION_LOCK_TIMEOUT * 1000)}")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            current = _version(conn)  # another worker may have migrated meanwhile
+            for version, fn in MIGRATIONS:
+                if version > current:
+                    fn(conn)
+                    conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+                    current = version
+            conn.commit()
+        finally:
+            # the connection goes back to the pool
+            conn.exec_driver_sql(f"PRAGMA busy_timeout = {SQLITE_PRAGMAS['busy_timeout']}")
+        return current
+
+
+@migration(1)
+def _baseline(conn: Connection):
+    """Original tables, plus products.seller_id for databases that predate it."""
+    Base.metadata.create_all(bind=conn)
+    cols = [row[1] for row in conn.execute(text("PRAGMA table_info(products)"))]
+    if "seller_id" not in cols:
+        conn.execute(text("ALTER TABLE products ADD COLUMN seller_id INTEGER REFERENCES users(id)"))
+
+
+@migration(2)
+def _product_search(conn: Connection):
+    """FTS5 index over product name/description, kept in sync by triggers."""
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    ).first()
+    if exists:
+        return
+    conn.execute(text(
+        """CREATE VIRTUAL TABLE products_fts USING fts5(
+            name, description,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )"""
+    ))
+    conn.execute(text(
+        """CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END"""
+    ))
+    conn.execute(text(
+        """CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END"""
+    ))
+    conn.execute(text(
+        """CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO products_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END"""
+    ))
+    conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+@migration(3)
+def _hot_path_indexes(conn: Connection):
+    """Indexes for category/seller listings and order lookups by date, email and order."""
+    for table in (models.Product.__table__, models.Order.__table__, models.OrderItem.__table__):
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+    # refresh planner statistics so the new indexes are actually chosen
+    conn.exec_driver_sql("PRAGMA optimize")
+
+
+@migration(4)
+def _seller_sales(conn: Connection):
+    """Seller sales rollups behind GET /seller/stats (backfilled by migration 11)."""
+    Base.metadata.create_all(
+        bind=conn,
+        tables=[models.SellerDailySales.__table__, models.SellerProductSales.__table__],
+    )
+
+
+@migration(5)
+def _sales_analytics(conn: Connection):
+    """Hourly store and per-category rollups behind GET /admin/analytics (backfilled by migration 11)."""
+    Base.metadata.create_all(
+        bind=conn,
+        tables=[models.SalesHourly.__table__, models.CategorySalesHourly.__table__],
+    )
+
+
+@migration(6)
+def _stock_ledger(conn: Connection):
+    """Stock ledger with opening balances, idempotency keys, and the pending-order expiry index."""
+    Base.metadata.create_all(
+        bind=conn,
+        tables=[models.StockLedger.__table__, models.IdempotencyKey.__table__],
+    )
+    for index in models.Order.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    # existing stock becomes each product's opening balance
+    conn.execute(text(
+        """INSERT INTO stock_ledger (product_id, delta, reason, created_at)
+        SELECT id, stock, 'opening', :now FROM products WHERE stock != 0"""
+    ), {"now": datetime.utcnow()})
+    # products created from here on get theirs from a trigger, so bulk inserts are covered too
+    conn.execute(text(
+        """CREATE TRIGGER IF NOT EXISTS stock_ledger_opening AFTER INSERT ON products
+        WHEN new.stock != 0 BEGIN
+            INSERT INTO stock_ledger (product_id, delta, reason, created_at)
+            VALUES (new.id, new.stock, 'opening', strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+        END"""
+    ))
+
+
+@migration(7)
+def _jobs(conn: Connection):
+    """Durable background job table."""
+    Base.metadata.create_all(bind=conn, tables=[models.Job.__table__])
+
+
+@migration(8)
+def _product_thumbnails(conn: Connection):
+    """Thumbnail URL for uploaded product images."""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(products)"))}
+    if "thumbnail_url" not in columns:
+        conn.execute(text("ALTER TABLE products ADD COLUMN thumbnail_url VARCHAR(500)"))
+
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+# (trigger name, event, tag expression, WHEN condition)
+_CACHE_TRIGGERS = [
+    ("products_cache_ai", "INSERT ON products", "'products'", None),
+    ("products_cache_au", "UPDATE ON products", "'product:' || new.id", None),
+    (
+        "products_cache_au_listings",
+        "UPDATE OF category_id, name, description ON products",
+        "'products'",
+        "old.category_id IS NOT new.category_id OR old.name IS NOT new.name"
+        " OR old.description IS NOT new.description",
+    ),
+    ("products_cache_ad", "DELETE ON products", "'product:' || old.id", None),
+    ("categories_cache_ai", "INSERT ON categories", "'categories'", None),
+    ("categories_cache_au", "UPDATE ON categories", "'categories'", None),
+    ("categories_cache_ad", "DELETE ON categories", "'categories'", None),
+    (
+        "users_cache_au",
+        "UPDATE OF role, is_active ON users",
+        "'user:' || new.id",
+        "old.role IS NOT new.role OR old.is_active IS NOT new.is_active",
+    ),
+    ("users_cache_ad", "DELETE ON users", "'user:' || old.id", None),
+]
+
+
+@migration(9)
+def _cache_invalidations(conn: Connection):
+    """Invalidation log that lets every worker process drop cache entries another one made stale."""
+    Base.metadata.create_all(bind=conn, tables=[models.CacheInvalidation.__table__])
+    for name, on, tag, when in _CACHE_TRIGGERS:
+        conn.execute(text(
+            f"""CREATE TRIGGER IF NOT EXISTS {name} AFTER {on}
+            {f"WHEN {when} " if when else ""}BEGIN
+                INSERT INTO cache_invalidations (tag, created_at) VALUES ({tag}, {_NOW});
+            END"""
+        ))
+
+
+@migration(10)
+def _catalog_facets(conn: Connection):
+    """Indexes for price/newest sorts and facet counts; listing invalidation on price, stock-out and delete."""
+    for index in models.Product.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    conn.execute(text("DROP TRIGGER IF EXISTS products_cache_au_listings"))
+    conn.execute(text(
+        f"""CREATE TRIGGER products_cache_au_listings
+        AFTER UPDATE OF category_id, name, description, price, stock ON products
+        WHEN old.category_id IS NOT new.category_id OR old.name IS NOT new.name
+            OR old.description IS NOT new.description OR old.price IS NOT new.price
+            OR (old.stock > 0) IS NOT (new.stock > 0) BEGIN
+            INSERT INTO cache_invalidations (tag, created_at) VALUES ('products', {_NOW});
+        END"""
+    ))
+    conn.execute(text(
+        f"""CREATE TRIGGER IF NOT EXISTS products_cache_ad_listings AFTER DELETE ON products BEGIN
+            INSERT INTO cache_invalidations (tag, created_at) VALUES ('products', {_NOW});
+        END"""
+    ))
+    conn.exec_driver_sql("PRAGMA optimize")
+
+
+@migration(11)
+def _order_item_sale_keys(conn: Connection):
+    """Seller and category at sale time on order_items, so cancelling an order reverses exactly what it added.
+
+    Existing lines get their product's current values, the best record there
+    is, and the rollups are rebuilt from them so both agree from here on.
+    """
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(order_items)"))}
+    for column in ("seller_id", "category_id"):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE order_items ADD COLUMN {column} INTEGER"))
+    conn.execute(text(
+        """UPDATE order_items SET
+            seller_id = (SELECT seller_id FROM products WHERE products.id = order_items.product_id),
+            category_id = (SELECT category_id FROM products WHERE products.id = order_items.product_id)
+        WHERE seller_id IS NULL AND category_id IS NULL"""
+    ))
+    rebuild_seller_sales(conn)
+    rebuild_sales_analytics(conn)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -36,6 +36,7 @@ class Product(Base):
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False)
     image_url = Column(String(500), nullable=True)
+    thumbnail_url = Column(String(500), nullable=True)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     seller_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     stock = Column(Integer, default=0)
@@ -45,13 +46,24 @@ class Product(Base):
     seller = relationship("User", back_populates="products")
     order_items = relationship("OrderItem", back_populates="product")
 
+    __table_args__ = (
+        # id is the rowid, so these also serve "filter, then ORDER BY id" keyset pages
+        Index("ix_products_category_id", "category_id"),
+        Index("ix_products_category_id_created_at", "category_id", "created_at"),
+        Index("ix_products_seller_id_id", "seller_id", "id"),
+        # price sort/range pages, also covering (category_id, price) facet counts
+        Index("ix_products_price", "price"),
+        Index("ix_products_category_id_price", "category_id", "price"),
+        Index("ix_products_created_at", "created_at"),
+    )
+
 
 class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
     customer_name = Column(String(200), nullable=False)
-    email = Column(String(200), nullable=False)
+    email = Column(String(200), nullable=False, index=True)
     phone = Column(String(50), nullable=True)
     address = Column(Text, nullable=False)
     total = Column(Float, nullable=False)
@@ -60,15 +72,133 @@ class Order(Base):
 
     items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_status_created_at", "status", "created_at"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
+    # the product's seller and category when it was sold, which the sales rollups are keyed by
+    seller_id = Column(Integer, nullable=True)
+    category_id = Column(Integer, nullable=True)
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
+
+
+class SellerDailySales(Base):
+    """Per-seller, per-day (UTC) sales rollup, maintained by create_order."""
+    __tablename__ = "seller_daily_sales"
+
+    seller_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class SellerProductSales(Base):
+    """Lifetime sales per product, for a seller's top-product ranking."""
+    __tablename__ = "seller_product_sales"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    seller_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_seller_product_sales_seller_id_revenue", "seller_id", "revenue"),
+    )
+
+
+class SalesHourly(Base):
+    """Store-wide sales per hour (UTC), the finest grain of GET /admin/analytics."""
+    __tablename__ = "sales_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class CategorySalesHourly(Base):
+    """Sales per category per hour; category_id 0 collects uncategorized products."""
+    __tablename__ = "category_sales_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class StockLedger(Base):
+    """Append-only record of every change to products.stock.
+
+    "opening" entries (written by a trigger when a product is created) set the
+    starting level; "reserve"/"release" entries come from orders being placed
+    and cancelled or expired; "adjust" entries from manual stock edits. A
+    product's stock always equals the sum of its deltas.
+    """
+    __tablename__ = "stock_ledger"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String(20), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_stock_ledger_product_id_id", "product_id", "id"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Stored response of a request made with an Idempotency-Key header, for replay on retry."""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the request body
+    status_code = Column(Integer, nullable=False)
+    body = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class Job(Base):
+    """Durable background job, claimed and run by app.jobs.JobQueue."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)  # lease on a running job
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+
+class CacheInvalidation(Base):
+    """Cache tags made stale by a committed write, appended by triggers (see app.coherence)."""
+    __tablename__ = "cache_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    tag = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("greenmart.offload")
+
+
+class OffloadUnavailable(Exception):
+    """Raised when a pool cannot take the call right now; callers should answer 503."""
+
+
+class OffloadQueueFull(OffloadUnavailable):
+    """Raised when a pool's wait queue is full; callers should shed the request."""
+
+
+class ProcessOffloader:
+    """Runs CPU-bound functions in a lazily started process pool.
+
+    At most max_concurrency calls run at once and at most max_queue more wait
+    for a slot; beyond that run() fails fast with OffloadQueueFull instead of
+    letting a burst pile up unbounded. A pool whose worker died (OOM kill,
+    SIGKILL) is broken for good, so it is replaced and the call retried once.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the parent has event loop and DB driver threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                raise OffloadQueueFull()
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            for _ in range(2):
+                executor = self._get_executor()
+                try:
+                    return await loop.run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    logger.warning("process pool broken; starting a new one")
+                    self._discard(executor)
+            raise OffloadUnavailable()
+        finally:
+            self._slots.release()
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # concurrent calls all see the same broken pool; only the first replaces it
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
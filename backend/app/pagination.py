@@ -0,0 +1,173 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import DateTime, and_, false, or_, tuple_
+
+from app.models import Order, Product
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+# Serve full list pages like ?fields= projections: plain column tuples encoded
+# with orjson, skipping ORM objects and per-row response_model validation.
+FAST_JSON = os.environ.get("GREENMART_FAST_JSON", "0") == "1"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+PRODUCT_SORTS = {
+    "id": (Product.id,),
+    "created_at": (Product.created_at, Product.id),
+    "price": (Product.price, Product.id),
+}
+ORDER_SORTS = {
+    "id": (Order.id,),
+    "created_at": (Order.created_at, Order.id),
+}
+
+
+class KeysetPage:
+    """Keyset (seek) pagination over a fixed set of sort keys.
+
+    Each sort key maps to a tuple of columns ending in a unique column (the
+    primary key), so the last row of a page identifies exactly where the next
+    page starts. The cursor is an opaque base64 token of those column values.
+    Nullable leading columns follow SQLite's ordering, NULLs first ascending
+    and last descending, with the primary key breaking ties among them.
+    """
+
+    def __init__(
+        self,
+        model,
+        sorts: Dict[str, Tuple],
+        sort: str,
+        cursor: Optional[str],
+        limit: int,
+        fields: Optional[str] = None,
+        schema: Optional[Type[BaseModel]] = None,
+        include: Optional[str] = None,
+    ):
+        self.descending = sort.startswith("-")
+        key = sort[1:] if self.descending else sort
+        if key not in sorts:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid sort '{sort}'. Allowed: {', '.join(sorted(sorts))}",
+            )
+        self.model = model
+        self.sort = sort
+        self.columns = sorts[key]
+        self.limit = limit
+        self.after = self._decode(cursor) if cursor else None
+        self.fields = None
+        if fields:
+            # relationships can only be loaded onto whole mapped rows
+            if include:
+                raise HTTPException(status_code=400, detail="include cannot be combined with fields")
+            self.fields = self._parse_fields(fields, schema)
+        elif FAST_JSON and schema is not None and not include:
+            self.fields = self._schema_columns(schema)
+
+    def _schema_columns(self, schema: Type[BaseModel]) -> List[str]:
+        """Schema fields backed by a table column, in schema (= output) order."""
+        table_cols = self.model.__table__.columns.keys()
+        return [f for f in schema.model_fields if f in table_cols]
+
+    def _parse_fields(self, fields: str, schema: Type[BaseModel]) -> List[str]:
+        allowed = self._schema_columns(schema)
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in allowed]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}",
+            )
+        if "id" not in requested:
+            requested.insert(0, "id")
+        return requested
+
+    @property
+    def entities(self) -> list:
+        """Entities to select: the mapped class, or only the projected columns plus sort keys."""
+        if self.fields is None:
+            return [self.model]
+        names = list(self.fields)
+        names += [c.key for c in self.columns if c.key not in names]
+        return [getattr(self.model, n) for n in names]
+
+    def apply(self, stmt):
+        """Add the keyset predicate, ordering and limit to a Select or Query."""
+        if self.after is not None:
+            if any(c.nullable for c in self.columns):
+                stmt = stmt.where(self._seek(self.columns, self.after))
+            else:
+                key, bound = tuple_(*self.columns), tuple_(*self.after)
+                stmt = stmt.where(key < bound if self.descending else key > bound)
+        order = [c.desc() if self.descending else c.asc() for c in self.columns]
+        # one extra row tells us whether there is a next page
+        return stmt.order_by(*order).limit(self.limit + 1)
+
+    def _seek(self, columns, values):
+        """Rows past values in sort order, spelled out so NULLs compare like ORDER BY."""
+        column, value = columns[0], values[0]
+        if value is None:
+            past = false() if self.descending else column.is_not(None)
+            same = column.is_(None)
+        else:
+            past = column < value if self.descending else column > value
+            if self.descending and column.nullable:
+                past = or_(past, column.is_(None))
+            same = column == value
+        if len(columns) == 1:
+            return past
+        return or_(past, and_(same, self._seek(columns[1:], values[1:])))
+
+    def scalars(self, result) -> Sequence:
+        """Rows from an executed Select: ORM objects, or Row tuples when projecting."""
+        return result.scalars().all() if self.fields is None else result.all()
+
+    def respond(self, rows: Sequence, response: Response, schema: Optional[Type[BaseModel]] = None):
+        """Trim the look-ahead row, set the next cursor header and shape the body.
+
+        Pass schema to serialize full rows with a richer model than the route's
+        response_model, e.g. one including eager-loaded relationships.
+        """
+        rows = list(rows)
+        headers = {}
+        if len(rows) > self.limit:
+            rows = rows[: self.limit]
+            headers[NEXT_CURSOR_HEADER] = self._encode(rows[-1])
+        if self.fields is None and schema is None:
+            response.headers.update(headers)
+            return rows
+        if self.fields is None:
+            adapter = TypeAdapter(List[schema])
+            body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+            return Response(content=body, media_type="application/json", headers=headers)
+        # column values are already JSON-native (or datetimes, which orjson encodes)
+        body = [dict(zip(self.fields, row)) for row in rows]
+        return ORJSONResponse(content=body, headers=headers)
+
+    def _encode(self, row) -> str:
+        values = [getattr(row, c.key) for c in self.columns]
+        payload = {"s": self.sort, "k": jsonable_encoder(values)}
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return token.rstrip("=")
+
+    def _decode(self, cursor: str) -> tuple:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload["s"] != self.sort or len(payload["k"]) != len(self.columns):
+                raise ValueError("cursor does not match sort")
+            return tuple(
+                datetime.fromisoformat(v) if v is not None and isinstance(c.type, DateTime) else v
+                for c, v in zip(self.columns, payload["k"])
+            )
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
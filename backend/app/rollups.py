@@ -0,0 +1,159 @@
+"""Sales rollups kept in step with orders.
+
+Order creation and status changes add (or subtract) each order's lines to
+the rollup tables inside their own transaction, so dashboards and analytics
+read a few pre-aggregated rows instead of scanning orders/order_items. The
+rebuild functions recompute a rollup from history, for bulk-loaded data or if
+it is ever suspected to have drifted.
+"""
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, distinct, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models import (
+    CategorySalesHourly,
+    Order,
+    OrderItem,
+    SalesHourly,
+    SellerDailySales,
+    SellerProductSales,
+)
+
+# Orders in these statuses are not sales; moving in or out of them reverses
+# or re-applies the order's contribution.
+EXCLUDED_STATUSES = ("cancelled", "expired")
+UNCATEGORIZED = 0
+
+# (seller_id, category_id, product_id, quantity, unit price) for one order line
+SaleLine = Tuple[Optional[int], Optional[int], int, int, float]
+
+_hourly = SalesHourly.__table__
+_category_hourly = CategorySalesHourly.__table__
+_seller_daily = SellerDailySales.__table__
+_seller_product = SellerProductSales.__table__
+_COUNTERS = ("revenue", "units", "orders")
+# matches how the DateTime type stores values, so upserts hit rebuilt rows
+_SQL_HOUR = "%Y-%m-%d %H:00:00.000000"
+
+
+def counts_as_sale(status: Optional[str]) -> bool:
+    return status not in EXCLUDED_STATUSES
+
+
+def order_sale_lines(order: Order) -> List[SaleLine]:
+    """Sale lines of a stored order, under the seller and category it was sold
+    with, so reversing it subtracts from the same rollup rows it was added to."""
+    return [
+        (item.seller_id, item.category_id, item.product_id, item.quantity, item.price)
+        for item in order.items
+    ]
+
+
+def _accumulate(table, keys: List[str]):
+    """Upsert that adds the row's counters to an existing row instead of replacing it."""
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: table.c[c] + stmt.excluded[c] for c in _COUNTERS},
+    )
+
+
+_add_hourly = _accumulate(_hourly, ["hour"])
+_add_category_hourly = _accumulate(_category_hourly, ["hour", "category_id"])
+_add_seller_daily = _accumulate(_seller_daily, ["seller_id", "day"])
+_add_seller_product = _accumulate(_seller_product, ["product_id"])
+
+
+def sales_updates(
+    created_at: datetime, lines: Iterable[SaleLine], sign: int = 1
+) -> List[Tuple[Any, List[dict]]]:
+    """(statement, executemany parameters) pairs adding one order to every rollup.
+
+    Pass sign=-1 to take a previously counted order back out.
+    """
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    hourly, categories, seller_daily, seller_product = {}, {}, {}, {}
+    for seller_id, category_id, product_id, quantity, price in lines:
+        category_id = category_id or UNCATEGORIZED
+        rows = [
+            hourly.setdefault(hour, {"hour": hour}),
+            categories.setdefault(category_id, {"hour": hour, "category_id": category_id}),
+        ]
+        if seller_id is not None:
+            rows.append(seller_daily.setdefault(seller_id, {"seller_id": seller_id, "day": created_at.date()}))
+            rows.append(seller_product.setdefault(product_id, {"product_id": product_id, "seller_id": seller_id}))
+        for row in rows:
+            row["revenue"] = row.get("revenue", 0.0) + sign * price * quantity
+            row["units"] = row.get("units", 0) + sign * quantity
+            row["orders"] = sign  # one order, however many of its lines match
+    return [
+        (stmt, list(rows.values()))
+        for stmt, rows in (
+            (_add_hourly, hourly),
+            (_add_category_hourly, categories),
+            (_add_seller_daily, seller_daily),
+            (_add_seller_product, seller_product),
+        )
+        if rows
+    ]
+
+
+def _sold_lines():
+    """Empty select over every counted order line, to add grouping columns to."""
+    return (
+        select()
+        .select_from(OrderItem)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.status.notin_(EXCLUDED_STATUSES))
+    )
+
+
+_TOTALS = (
+    func.sum(OrderItem.price * OrderItem.quantity),
+    func.sum(OrderItem.quantity),
+    func.count(distinct(OrderItem.order_id)),
+)
+
+
+def rebuild_seller_sales(conn) -> int:
+    """Recompute both seller rollups from order_items; returns the number of daily rows."""
+    conn.execute(delete(_seller_daily))
+    conn.execute(delete(_seller_product))
+    sold = _sold_lines().where(OrderItem.seller_id.isnot(None))
+    day = func.date(Order.created_at)
+    daily = conn.execute(insert(_seller_daily).from_select(
+        ["seller_id", "day", *_COUNTERS],
+        sold.add_columns(OrderItem.seller_id, day, *_TOTALS).group_by(OrderItem.seller_id, day),
+    ))
+    conn.execute(insert(_seller_product).from_select(
+        ["product_id", "seller_id", *_COUNTERS],
+        sold.add_columns(OrderItem.product_id, OrderItem.seller_id, *_TOTALS)
+        .group_by(OrderItem.product_id, OrderItem.seller_id),
+    ))
+    return daily.rowcount
+
+
+def rebuild_sales_analytics(conn) -> int:
+    """Recompute the hourly and per-category hourly rollups; returns the number of hours."""
+    conn.execute(delete(_hourly))
+    conn.execute(delete(_category_hourly))
+    hour = func.strftime(_SQL_HOUR, Order.created_at)
+    category = func.coalesce(OrderItem.category_id, UNCATEGORIZED)
+    hourly = conn.execute(insert(_hourly).from_select(
+        ["hour", *_COUNTERS],
+        _sold_lines().add_columns(hour, *_TOTALS).group_by(hour),
+    ))
+    conn.execute(insert(_category_hourly).from_select(
+        ["hour", "category_id", *_COUNTERS],
+        _sold_lines().add_columns(hour, category, *_TOTALS).group_by(hour, category),
+    ))
+    return hourly.rowcount
+
+
+# name -> rebuild function, for rebuild_rollups.py and bulk loaders
+REBUILDS = {
+    "seller-sales": rebuild_seller_sales,
+    "sales-analytics": rebuild_sales_analytics,
+}
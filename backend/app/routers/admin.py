@@ -1,62 +1,333 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Literal, Optional
 
-from app.database import get_db
-from app.models import Product, Category, Order
+from app.cache import LISTING_COLUMNS, invalidate_products
+from app.database import AsyncReadSessionLocal, get_read_db, get_write_db
+from app.models import Product, Category, CategorySalesHourly, Order, OrderItem, SalesHourly, StockLedger
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT, ORDER_SORTS, PRODUCT_SORTS, KeysetPage
 from app.schemas import (
     Product as ProductSchema,
     ProductCreate,
     ProductUpdate,
     Category as CategorySchema,
     Order as OrderSchema,
+    OrderWithItems,
+    OrderStatusUpdate,
+    StockAudit,
+    CategorySales,
+    SalesAnalytics,
+    SalesBucket,
 )
+from app.rollups import UNCATEGORIZED
+from app.stock import PENDING_ORDER_TTL, adjustment, change_order_status, expire_pending_orders, record_adjustment
+from app.streaming import FORMATS, csv_line, ndjson_line
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+EXPORT_BATCH_SIZE = 1000
+ORDER_EXPORT_COLUMNS = list(OrderSchema.model_fields)
+ITEM_EXPORT_COLUMNS = ["id", "product_id", "quantity", "price"]
+
+MAX_ANALYTICS_BUCKETS = 1000
+# bucket -> (strftime arguments turning a rollup hour into its bucket start, step, default span)
+ANALYTICS_BUCKETS = {
+    "hour": (("%Y-%m-%d %H:00:00",), timedelta(hours=1), timedelta(days=2)),
+    "day": (("%Y-%m-%d 00:00:00",), timedelta(days=1), timedelta(days=30)),
+    # weeks start on Monday: back up to the previous Monday unless already on one
+    "week": (("%Y-%m-%d 00:00:00", "-6 days", "weekday 1"), timedelta(weeks=1), timedelta(weeks=26)),
+}
+
 
 @router.get("/products", response_model=List[ProductSchema])
-def list_products(db: Session = Depends(get_db)):
-    return db.query(Product).all()
+def list_products(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("id"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    db: Session = Depends(get_read_db),
+):
+    page = KeysetPage(Product, PRODUCT_SORTS, sort, cursor, limit, fields, ProductSchema)
+    return page.respond(page.apply(db.query(*page.entities)).all(), response)
 
 
 @router.post("/products", response_model=ProductSchema)
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+def create_product(product: ProductCreate, db: Session = Depends(get_write_db)):
     p = Product(**product.model_dump())
     db.add(p)
     db.commit()
     db.refresh(p)
+    invalidate_products([p.id], listings=True)
     return p
 
 
 @router.put("/products/{product_id}", response_model=ProductSchema)
-def update_product(product_id: int, product: ProductUpdate, db: Session = Depends(get_db)):
+def update_product(product_id: int, product: ProductUpdate, db: Session = Depends(get_write_db)):
     p = db.query(Product).filter(Product.id == product_id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Product not found")
     data = product.model_dump(exclude_unset=True)
+    if "stock" in data:
+        db.execute(record_adjustment, adjustment(p.id, data["stock"]))
     for k, v in data.items():
         setattr(p, k, v)
     db.commit()
     db.refresh(p)
+    invalidate_products([p.id], listings=bool(LISTING_COLUMNS & data.keys()))
     return p
 
 
 @router.delete("/products/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
+def delete_product(product_id: int, db: Session = Depends(get_write_db)):
     p = db.query(Product).filter(Product.id == product_id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Product not found")
     db.delete(p)
     db.commit()
+    invalidate_products([product_id], listings=True)
     return {"ok": True}
 
 
 @router.get("/orders", response_model=List[OrderSchema])
-def list_orders(db: Session = Depends(get_db)):
-    return db.query(Order).order_by(Order.created_at.desc()).all()
+def list_orders(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("-created_at"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    include: Optional[Literal["items"]] = Query(
+        None, description="Embed each order's line items (loaded in one extra query per page)"
+    ),
+    db: Session = Depends(get_read_db),
+):
+    page = KeysetPage(Order, ORDER_SORTS, sort, cursor, limit, fields, OrderSchema, include)
+    q = db.query(*page.entities)
+    if include:
+        q = q.options(selectinload(Order.items))
+    return page.respond(page.apply(q).all(), response, OrderWithItems if include else None)
+
+
+@router.get("/orders/export")
+async def export_orders(
+    fmt: Literal["csv", "ndjson"] = Query("ndjson", alias="format"),
+    start: Optional[datetime] = Query(None, description="Orders created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Orders created before this time"),
+):
+    """Stream orders with their line items, oldest first.
+
+    NDJSON emits one order per line with an "items" array; CSV emits one line
+    per item with the order columns repeated (item_* columns empty for orders
+    without items).
+    """
+    stmt = (
+        select(
+            *(getattr(Order, c) for c in ORDER_EXPORT_COLUMNS),
+            *(getattr(OrderItem, c).label(f"item_{c}") for c in ITEM_EXPORT_COLUMNS),
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+    if start is not None:
+        stmt = stmt.where(Order.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Order.created_at < end)
+
+    async def rows():
+        if fmt == "csv":
+            yield csv_line(ORDER_EXPORT_COLUMNS + [f"item_{c}" for c in ITEM_EXPORT_COLUMNS])
+        current = None
+        # own session: the request's dependencies are torn down before the body streams
+        async with AsyncReadSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for batch in result.partitions():
+                if fmt == "csv":
+                    yield "".join(csv_line(row) for row in batch)
+                    continue
+                # rows arrive grouped by order; emit each order once its last item is seen
+                chunk = []
+                for row in batch:
+                    if current is None or current["id"] != row.id:
+                        if current is not None:
+                            chunk.append(ndjson_line(current))
+                        current = {c: getattr(row, c) for c in ORDER_EXPORT_COLUMNS}
+                        current["items"] = []
+                    if row.item_id is not None:
+                        current["items"].append(
+                            {c: getattr(row, f"item_{c}") for c in ITEM_EXPORT_COLUMNS}
+                        )
+                if chunk:
+                    yield "".join(chunk)
+        if current is not None:
+            yield ndjson_line(current)
+
+    return StreamingResponse(
+        rows(),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="orders.{fmt}"'},
+    )
+
+
+@router.get("/orders/{order_id}", response_model=OrderWithItems)
+def get_order(order_id: int, db: Session = Depends(get_read_db)):
+    order = db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+@router.patch("/orders/{order_id}/status", response_model=OrderSchema)
+def update_order_status(order_id: int, update: OrderStatusUpdate, db: Session = Depends(get_write_db)):
+    order = (
+        db.query(Order)
+        .options(selectinload(Order.items))
+        .filter(Order.id == order_id)
+        .first()
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # cancelling releases the order's stock and takes it out of the sales rollups; reinstating re-reserves
+    restocked = change_order_status(db, order, update.status)
+    db.commit()
+    invalidate_products(restocked, listings=bool(restocked))
+    return order
+
+
+@router.post("/orders/expire")
+def expire_orders(
+    older_than_minutes: Optional[float] = Query(
+        None, gt=0, description="Defaults to GREENMART_PENDING_ORDER_TTL_MINUTES"
+    ),
+    db: Session = Depends(get_write_db),
+):
+    """Expire stale pending orders and release their reserved stock."""
+    older_than = timedelta(minutes=older_than_minutes) if older_than_minutes else PENDING_ORDER_TTL
+    if not older_than:
+        raise HTTPException(status_code=400, detail="No pending order TTL configured; pass older_than_minutes")
+    released = expire_pending_orders(db, older_than)
+    invalidate_products(released, listings=bool(released))
+    return {"ok": True, "products_restocked": len(released)}
+
+
+@router.get("/products/{product_id}/stock", response_model=StockAudit)
+def product_stock(
+    product_id: int,
+    limit: int = Query(50, ge=0, le=MAX_LIMIT, description="Most recent ledger entries to include"),
+    db: Session = Depends(get_read_db),
+):
+    """Current stock next to the level derived from the stock ledger; they should match."""
+    product = db.query(Product.stock).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    balance = db.query(func.coalesce(func.sum(StockLedger.delta), 0)).filter(StockLedger.product_id == product_id).scalar()
+    entries = (
+        db.query(StockLedger)
+        .filter(StockLedger.product_id == product_id)
+        .order_by(StockLedger.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return StockAudit(product_id=product_id, stock=product.stock or 0, ledger_balance=balance, entries=entries)
+
+
+def _utc(moment: datetime) -> datetime:
+    """Naive UTC, as timestamps are stored."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _bucket_start(moment: datetime, bucket: str) -> datetime:
+    start = moment.replace(minute=0, second=0, microsecond=0)
+    if bucket != "hour":
+        start = start.replace(hour=0)
+    if bucket == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+@router.get("/analytics", response_model=SalesAnalytics)
+def sales_analytics(
+    bucket: Literal["hour", "day", "week"] = Query("day"),
+    start: Optional[datetime] = Query(None, description="Rounded down to its bucket (default: a bucket-sized span before end)"),
+    end: Optional[datetime] = Query(None, description="Exclusive (default: now)"),
+    db: Session = Depends(get_read_db),
+):
+    """Revenue, units, orders, average basket and per-category revenue per time bucket (UTC).
+
+    Served entirely from the hourly rollups maintained by order placement and
+    status changes; cancelled orders are excluded.
+    """
+    strftime_args, step, default_span = ANALYTICS_BUCKETS[bucket]
+    end = _utc(end) if end else datetime.utcnow()
+    start = _bucket_start(_utc(start) if start else end - default_span, bucket)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / step > MAX_ANALYTICS_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {MAX_ANALYTICS_BUCKETS} {bucket} buckets; narrow it or use a larger bucket",
+        )
+
+    def bucketed(model):
+        label = func.strftime(strftime_args[0], model.hour, *strftime_args[1:]).label("bucket")
+        totals = [func.sum(getattr(model, c)).label(c) for c in ("revenue", "units", "orders")]
+        return label, totals, (model.hour >= start, model.hour < end)
+
+    label, totals, in_range = bucketed(SalesHourly)
+    rows = db.execute(select(label, *totals).where(*in_range).group_by(label)).all()
+    label, totals, in_range = bucketed(CategorySalesHourly)
+    category_rows = db.execute(
+        select(label, CategorySalesHourly.category_id, Category.name, *totals)
+        .outerjoin(Category, Category.id == CategorySalesHourly.category_id)
+        .where(*in_range)
+        .group_by(label, CategorySalesHourly.category_id)
+        .order_by(label, totals[0].desc())
+    ).all()
+
+    categories = {}
+    for row in category_rows:
+        if row.orders:
+            categories.setdefault(row.bucket, []).append(CategorySales(
+                category_id=None if row.category_id == UNCATEGORIZED else row.category_id,
+                name=row.name,
+                revenue=round(row.revenue, 2),
+                units=row.units,
+                orders=row.orders,
+            ))
+    sold = {row.bucket: row for row in rows}
+    buckets = []
+    moment = start
+    while moment < end:
+        key = moment.strftime("%Y-%m-%d %H:%M:%S")
+        row = sold.get(key)
+        revenue, units, orders = (row.revenue, row.units, row.orders) if row else (0.0, 0, 0)
+        buckets.append(SalesBucket(
+            start=moment,
+            revenue=round(revenue, 2),
+            units=units,
+            orders=orders,
+            average_basket=round(revenue / orders, 2) if orders else 0.0,
+            categories=categories.get(key, []),
+        ))
+        moment += step
+    revenue = sum(b.revenue for b in buckets)
+    orders = sum(b.orders for b in buckets)
+    return SalesAnalytics(
+        bucket=bucket,
+        start=start,
+        end=end,
+        revenue=round(revenue, 2),
+        units=sum(b.units for b in buckets),
+        orders=orders,
+        average_basket=round(revenue / orders, 2) if orders else 0.0,
+        buckets=buckets,
+    )
 
 
 @router.get("/categories", response_model=List[CategorySchema])
-def list_categories(db: Session = Depends(get_db)):
+def list_categories(db: Session = Depends(get_read_db)):
     return db.query(Category).all()
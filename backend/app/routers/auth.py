@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db, serialized_write
 from app.models import User
 from app.schemas import UserCreate, UserLogin, UserResponse, TokenResponse
 from app.auth import (
-    get_password_hash,
-    verify_password,
+    Principal,
+    get_password_hash_async,
+    verify_password_async,
+    password_needs_rehash,
     create_access_token,
     get_user_by_email,
     require_user,
@@ -17,33 +20,42 @@ from datetime import timedelta
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
+def _email_taken() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Email already registered",
+    )
+
+
 @router.get("/me", response_model=UserResponse)
-def get_me(user: User = Depends(require_user)):
+def get_me(user: Principal = Depends(require_user)):
     return user
 
 
 @router.post("/signup", response_model=TokenResponse)
-def signup(user_in: UserCreate, db: Session = Depends(get_db)):
-    existing = get_user_by_email(db, user_in.email)
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered",
-        )
+async def signup(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
     if user_in.role not in ("buyer", "seller"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Role must be 'buyer' or 'seller'",
         )
+    if await get_user_by_email(db, user_in.email):
+        raise _email_taken()
+    # hash before taking the write lock, which would otherwise be held for the whole bcrypt call
     user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await get_password_hash_async(user_in.password),
         full_name=user_in.full_name,
         role=user_in.role,
     )
+    await db.rollback()  # end the read snapshot from the duplicate check
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        async with serialized_write():
+            await db.commit()
+    except IntegrityError:
+        # the same email signed up while we were hashing
+        raise _email_taken()
     token = create_access_token(
         data={"sub": str(user.id)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
@@ -60,9 +72,9 @@ def signup(user_in: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, credentials.email)
-    if not user or not verify_password(credentials.password, user.hashed_password):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email(db, credentials.email)
+    if not user or not await verify_password_async(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
@@ -72,6 +84,11 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is disabled",
         )
+    if password_needs_rehash(user.hashed_password):
+        # the plaintext is only available now, so upgrade the stored cost here
+        user.hashed_password = await get_password_hash_async(credentials.password)
+        async with serialized_write():
+            await db.commit()
     token = create_access_token(
         data={"sub": str(user.id)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+from typing import List, Optional
+from urllib.parse import unquote
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app import admission
+from app.auth import Principal, batch_principal, get_current_user
+from app.database import AsyncReadSessionLocal, ReadSessionLocal, batch_async_read_db, batch_read_db
+from app.images import IMAGE_URL_PREFIX
+from app.schemas import BatchRequest, BatchResult
+
+logger = logging.getLogger("greenmart.batch")
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+MAX_BATCH_SIZE = int(os.environ.get("GREENMART_MAX_BATCH_SIZE", "20"))
+MAX_BATCH_RESPONSE_BYTES = int(os.environ.get("GREENMART_MAX_BATCH_RESPONSE_MB", "5")) * 1024 * 1024
+
+# scope keys a sub-request inherits from the batch request
+_INHERITED_SCOPE = ("type", "asgi", "http_version", "scheme", "server", "client", "root_path", "app",
+                    "starlette.exception_handlers", "extensions")
+# request headers that describe the batch's own body or caching, not the sub-requests
+_DROPPED_HEADERS = frozenset({
+    b"content-length", b"content-type", b"transfer-encoding", b"expect", b"if-none-match", b"if-modified-since",
+})
+
+
+class _ResponseTooLarge(Exception):
+    pass
+
+
+@router.post("", response_model=List[BatchResult])
+async def batch(
+    payload: BatchRequest,
+    request: Request,
+    user: Optional[Principal] = Depends(get_current_user),
+):
+    """Run several GET requests in one round trip; results come back in request order.
+
+    Sub-requests go through the same routes (and response cache) as direct
+    calls, with the batch's credentials, which are resolved once. Those
+    using read sessions share one, so they all see the same snapshot.
+    """
+    if len(payload.requests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {MAX_BATCH_SIZE} requests")
+    for item in payload.requests:
+        if item.path.startswith(("/batch", IMAGE_URL_PREFIX + "/")):
+            raise HTTPException(status_code=400, detail=f"{item.path} cannot be requested in a batch")
+    if admission.RATE_LIMITING and len(payload.requests) > 1:
+        # the middleware charged this request as one read
+        wait = admission.buckets[admission.READ].take(
+            admission.client_key(request.scope), cost=len(payload.requests) - 1
+        )
+        if wait:
+            raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(int(wait) + 1)})
+
+    headers = [(k, v) for k, v in request.scope["headers"] if k not in _DROPPED_HEADERS]
+    budget = [MAX_BATCH_RESPONSE_BYTES]
+    results = []
+    db, async_db = ReadSessionLocal(), AsyncReadSessionLocal()
+    tokens = (batch_read_db.set(db), batch_async_read_db.set(async_db), batch_principal.set((user,)))
+    try:
+        for item in payload.requests:
+            path, _, query = item.path.partition("?")
+            scope = {key: request.scope[key] for key in _INHERITED_SCOPE if key in request.scope}
+            scope.update(
+                method=item.method,
+                path=unquote(path),
+                raw_path=path.encode(),
+                query_string=query.encode(),
+                headers=headers,
+                state={},
+            )
+            try:
+                results.append(await _run(request.app.router, scope, budget))
+            except StarletteHTTPException as e:
+                # raised outside any route, e.g. no route matched the path
+                results.append(_result(e.status_code, e.headers or {}, json.dumps({"detail": e.detail}).encode()))
+            except _ResponseTooLarge:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Batch responses are limited to {MAX_BATCH_RESPONSE_BYTES // 2**20} MB; split the batch",
+                )
+            except Exception:
+                logger.exception("batched GET %s failed", item.path)
+                db.rollback()
+                await async_db.rollback()
+                results.append(_result(500, {}, b'{"detail":"Internal Server Error"}'))
+    finally:
+        for var, token in zip((batch_read_db, batch_async_read_db, batch_principal), tokens):
+            var.reset(token)
+        db.close()
+        await async_db.close()
+    return Response(content=b"[" + b",".join(results) + b"]", media_type="application/json")
+
+
+async def _run(app, scope, budget: list) -> bytes:
+    """Call app with a GET scope and return its response as a serialized BatchResult."""
+    start = {}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            budget[0] -= len(body)
+            if budget[0] < 0:
+                raise _ResponseTooLarge()
+            chunks.append(body)
+
+    await app(scope, receive, send)
+    headers = {}
+    content_type = ""
+    for key, value in start.get("headers", ()):
+        key = key.decode("latin-1").lower()
+        if key == "content-type":
+            content_type = value.decode("latin-1")
+        elif key.startswith("x-") or key in ("etag", "retry-after"):
+            headers[key] = value.decode("latin-1")
+    body = b"".join(chunks)
+    if not content_type.startswith("application/json"):
+        body = json.dumps(body.decode("utf-8", "replace")).encode() if body else b"null"
+    return _result(start.get("status", 500), headers, body)
+
+
+def _result(status: int, headers: dict, body: bytes) -> bytes:
+    return b'{"status":%d,"headers":%s,"body":%s}' % (status, json.dumps(headers).encode(), body or b"null")
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.database import get_db
+from app.cache import CATEGORIES_TAG, catalog_cache
+from app.database import get_async_read_db
 from app.models import Category
 from app.schemas import Category as CategorySchema
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
+_category_list = TypeAdapter(List[CategorySchema])
+
 
 @router.get("", response_model=List[CategorySchema])
-def get_categories(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+async def get_categories(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    cached = catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = await db.execute(select(Category))
+    return catalog_cache.store(request, result.scalars().all(), _category_list, tags=[CATEGORIES_TAG])
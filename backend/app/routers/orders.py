@@ -1,37 +1,96 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from datetime import datetime
 
-from app.database import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Optional
+
+from app.cache import invalidate_products
+from app.database import get_async_db, get_async_write_db
+from app.idempotency import IDEMPOTENCY_HEADER, fingerprint, remember, replay
 from app.models import Product, Order, OrderItem
+from app.rollups import sales_updates
 from app.schemas import OrderCreate, Order as OrderSchema, OrderWithItems
+from app.stock import RESERVE, order_entries, record_entries, stock_params, take_stock
+from app.tasks import enqueue_order_followups
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
 
+def _insufficient_stock(product: Product) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Insufficient stock for {product.name}. Available: {product.stock}",
+    )
+
+
+_order = TypeAdapter(OrderSchema)
+
+
 @router.post("", response_model=OrderSchema)
-def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(
+    order_data: OrderCreate,
+    idempotency_key: Optional[str] = Header(
+        None,
+        alias=IDEMPOTENCY_HEADER,
+        max_length=255,
+        description="Retries with the same key replay the first successful response instead of ordering again",
+    ),
+    db: AsyncSession = Depends(get_async_write_db),
+):
+    if idempotency_key:
+        request_fingerprint = fingerprint(order_data)
+        replayed = await replay(db, idempotency_key, request_fingerprint)
+        if replayed is not None:
+            return replayed
+
+    quantities = {}
+    for item in order_data.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    result = await db.execute(select(Product).where(Product.id.in_(quantities)))
+    products = {p.id: p for p in result.scalars()}
+
     total = 0
     order_items = []
-
+    sales = []
     for item in order_data.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
+        product = products.get(item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        if product.stock < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient stock for {product.name}. Available: {product.stock}",
-            )
-        item_total = product.price * item.quantity
-        total += item_total
+        if product.stock < quantities[product.id]:
+            raise _insufficient_stock(product)
+        total += product.price * item.quantity
         order_items.append(
             OrderItem(
                 product_id=product.id,
                 quantity=item.quantity,
                 price=product.price,
+                seller_id=product.seller_id,
+                category_id=product.category_id,
             )
         )
+        sales.append((product.seller_id, product.category_id, product.id, item.quantity, product.price))
+
+    # executemany needs at least one row; an order without items reserves nothing
+    if quantities:
+        updated = await db.execute(take_stock, stock_params(quantities))
+        if updated.rowcount != len(quantities):
+            # another order took the stock since we read it; report the current level
+            await db.rollback()
+            result = await db.execute(
+                select(Product).where(Product.id.in_(quantities)).execution_options(populate_existing=True)
+            )
+            for product in result.scalars():
+                if product.stock < quantities[product.id]:
+                    raise _insufficient_stock(product)
+            raise HTTPException(status_code=409, detail="Stock changed during checkout, please retry")
 
+    now = datetime.utcnow()
     order = Order(
         customer_name=order_data.customer_name,
         email=order_data.email,
@@ -39,24 +98,42 @@ def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
         address=order_data.address,
         total=total,
         status="pending",
+        created_at=now,
+        items=order_items,
     )
     db.add(order)
-    db.flush()
-
-    for oi in order_items:
-        oi.order_id = order.id
-        db.add(oi)
-        product = db.query(Product).get(oi.product_id)
-        product.stock -= oi.quantity
-
-    db.commit()
-    db.refresh(order)
-    return order
+    await db.flush()
+    # same transaction as the order, so the ledger, dashboards and analytics never drift from it
+    if quantities:
+        await db.execute(record_entries, order_entries(order.id, quantities, RESERVE))
+    for stmt, params in sales_updates(now, sales):
+        await db.execute(stmt, params)
+    # emails and alerts run after commit on the job queue, outside the request's latency
+    enqueue_order_followups(db, order.id, {pid: p.stock for pid, p in products.items()}, quantities)
+    body = _order.dump_json(_order.validate_python(order, from_attributes=True))
+    try:
+        if idempotency_key:
+            await remember(db, idempotency_key, request_fingerprint, 200, body)
+        await db.commit()
+    except IntegrityError:
+        # a concurrent request with the same key committed first
+        await db.rollback()
+        replayed = await replay(db, idempotency_key, request_fingerprint) if idempotency_key else None
+        if replayed is None:
+            raise
+        return replayed
+    # a product that sold out drops out of in_stock listings and their facet counts
+    sold_out = any(products[pid].stock <= qty for pid, qty in quantities.items())
+    invalidate_products(quantities, listings=sold_out)
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/{order_id}", response_model=OrderWithItems)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(Order).options(selectinload(Order.items)).where(Order.id == order_id)
+    )
+    order = result.scalar_one_or_none()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
@@ -1,29 +1,184 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import re
 
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import Integer, cast, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Literal, Optional, Union
+
+from app.cache import CATEGORIES_TAG, PRODUCT_LISTINGS_TAG, catalog_cache, product_tag
+from app.database import get_async_read_db
 from app.models import Product, Category
-from app.schemas import Product as ProductSchema
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER, PRODUCT_SORTS, KeysetPage
+from app.schemas import FacetedProducts, Product as ProductSchema, ProductFacets, ProductWithCategory
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+_product = TypeAdapter(ProductSchema)
+_product_list = TypeAdapter(List[ProductSchema])
+_product_with_category = TypeAdapter(ProductWithCategory)
+_product_with_category_list = TypeAdapter(List[ProductWithCategory])
+
+DEFAULT_PRICE_BUCKET = 10.0
+
+IncludeCategory = Query(None, description="Embed each product's category (loaded in the same query)")
+
+# bm25() weights per FTS column: a hit in the name counts 10x one in the description
+_search = text(
+    """
+    SELECT products.* FROM products_fts
+    JOIN products ON products.id = products_fts.rowid
+    WHERE products_fts MATCH :match
+    ORDER BY bm25(products_fts, 10.0, 1.0), products.id
+    LIMIT :limit OFFSET :offset
+    """
+)
+
+
+def _fts_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so user input can't inject FTS5 operators or syntax errors.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", q))
+
 
-@router.get("", response_model=List[ProductSchema])
-def get_products(
+@router.get("", response_model=Union[List[ProductSchema], FacetedProducts])
+async def get_products(
+    request: Request,
+    response: Response,
     category: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = Query(False, description="Only products with stock left"),
+    seller_id: Optional[int] = Query(None),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("id", description="id, price or created_at; prefix - to reverse (-created_at = newest)"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    include: Optional[Literal["category"]] = IncludeCategory,
+    facets: bool = Query(False, description='Wrap the page as {"items", "facets"} with category and price counts'),
+    price_bucket: float = Query(DEFAULT_PRICE_BUCKET, gt=0, description="Width of the facet price ranges"),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    q = db.query(Product)
+    cached = catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    page = KeysetPage(Product, PRODUCT_SORTS, sort, cursor, limit, fields, ProductSchema, include)
+    filters = []
+    if min_price is not None:
+        filters.append(Product.price >= min_price)
+    if max_price is not None:
+        filters.append(Product.price <= max_price)
+    if in_stock:
+        filters.append(Product.stock > 0)
+    if seller_id is not None:
+        filters.append(Product.seller_id == seller_id)
+    q = select(*page.entities).where(*filters)
     if category:
-        q = q.join(Category, Product.category_id == Category.id).filter(Category.slug == category)
-    return q.all()
+        q = q.join(Category, Product.category_id == Category.id).where(Category.slug == category)
+    adapter, tags = _product_list, [PRODUCT_LISTINGS_TAG]
+    if include:
+        q = q.options(joinedload(Product.category))
+        adapter, tags = _product_with_category_list, tags + [CATEGORIES_TAG]
+    result = await db.execute(page.apply(q))
+    rows = page.scalars(result)
+    tags += [product_tag(row.id) for row in rows]
+    content = page.respond(rows, response)
+    if facets:
+        if isinstance(content, Response):
+            items, headers = bytes(content.body), content.headers
+        else:
+            items, headers = adapter.dump_json(adapter.validate_python(content, from_attributes=True)), response.headers
+        counts = await _facets(db, filters, category, price_bucket)
+        content = Response(
+            b'{"items":' + items + b',"facets":' + counts + b"}",
+            media_type="application/json",
+            headers={k: v for k, v in headers.items() if k.startswith("x-")},
+        )
+        tags.append(CATEGORIES_TAG)
+    return catalog_cache.store(request, content, adapter, response, tags)
+
+
+async def _facets(db: AsyncSession, filters: list, category: Optional[str], price_bucket: float) -> bytes:
+    """Category counts and a price histogram for a filter, from one GROUP BY.
+
+    Category counts ignore the category filter, so the other categories show
+    what selecting them would return; the histogram honours it.
+    """
+    bucket = cast(Product.price / price_bucket, Integer).label("bucket")
+    grouped = (
+        select(Product.category_id, bucket, func.count().label("count"))
+        .where(*filters)
+        .group_by(Product.category_id, bucket)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(grouped.c.category_id, Category.slug, Category.name, grouped.c.bucket, grouped.c.count)
+        .outerjoin(Category, Category.id == grouped.c.category_id)
+    )).all()
+    by_category, by_price = {}, {}
+    for row in rows:
+        entry = by_category.setdefault(row.category_id, {
+            "category_id": row.category_id, "slug": row.slug, "name": row.name, "count": 0,
+        })
+        entry["count"] += row.count
+        if category is None or row.slug == category:
+            by_price[row.bucket] = by_price.get(row.bucket, 0) + row.count
+    result = ProductFacets(
+        total=sum(by_price.values()),
+        categories=sorted(by_category.values(), key=lambda c: (-c["count"], c["category_id"] or 0)),
+        price=[
+            {"min": round(b * price_bucket, 2), "max": round((b + 1) * price_bucket, 2), "count": n}
+            for b, n in sorted(by_price.items())
+        ],
+    )
+    return result.model_dump_json().encode()
+
+
+@router.get("/search", response_model=List[ProductSchema])
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+$"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    cached = catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    match = _fts_query(q)
+    rows = []
+    if match:
+        offset = int(cursor) if cursor else 0
+        stmt = select(Product).from_statement(_search)
+        params = {"match": match, "limit": limit + 1, "offset": offset}
+        rows = (await db.execute(stmt, params)).scalars().all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = str(offset + limit)
+    tags = [PRODUCT_LISTINGS_TAG] + [product_tag(p.id) for p in rows]
+    return catalog_cache.store(request, rows, _product_list, response, tags)
 
 
 @router.get("/{product_id}", response_model=ProductSchema)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def get_product(
+    product_id: int,
+    request: Request,
+    include: Optional[Literal["category"]] = IncludeCategory,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    cached = catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    if include:
+        product = await db.get(Product, product_id, options=[joinedload(Product.category)])
+        adapter, tags = _product_with_category, [CATEGORIES_TAG]
+    else:
+        product = await db.get(Product, product_id)
+        adapter, tags = _product, []
     if not product:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return catalog_cache.store(request, product, adapter, tags=tags + [product_tag(product.id)])
@@ -1,33 +1,265 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 
-from app.database import get_db
-from app.models import Product, User
-from app.schemas import Product as ProductSchema, ProductCreate, ProductUpdate
-from app.auth import require_seller
+from app.cache import LISTING_COLUMNS, invalidate_products
+from app.database import (
+    AsyncSessionLocal,
+    get_async_db,
+    get_db,
+    get_write_db,
+    serialized_write,
+)
+from app.images import MAX_IMAGE_BYTES, store_upload
+from app.models import Product, SellerDailySales, SellerProductSales
+from app.schemas import (
+    Product as ProductSchema,
+    ProductCreate,
+    ProductImportError,
+    ProductImportResult,
+    ProductUpdate,
+    SellerDailyStats,
+    SellerProductStats,
+    SellerStats,
+)
+from app.auth import Principal, require_seller
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT, PRODUCT_SORTS, KeysetPage
+from app.stock import adjustment, record_adjustment
+from app.streaming import FORMATS, csv_line, iter_lines, iter_records, ndjson_line, resolve_format
 
 router = APIRouter(prefix="/seller", tags=["seller"])
 
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+MAX_REPORTED_IMPORT_ERRORS = 100
+EXPORT_COLUMNS = ["id", *ProductCreate.model_fields, "created_at"]
+
+_products = Product.__table__
+_update_owned_product = (
+    update(_products)
+    .where(_products.c.id == bindparam("_id"))
+    .where(_products.c.seller_id == bindparam("_seller_id"))
+)
+
 
 @router.get("/products", response_model=List[ProductSchema])
 def list_my_products(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("id"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
     db: Session = Depends(get_db),
-    user: User = Depends(require_seller),
+    user: Principal = Depends(require_seller),
+):
+    page = KeysetPage(Product, PRODUCT_SORTS, sort, cursor, limit, fields, ProductSchema)
+    q = db.query(*page.entities).filter(Product.seller_id == user.id)
+    return page.respond(page.apply(q).all(), response)
+
+
+@router.get("/stats", response_model=SellerStats)
+async def sales_stats(
+    days: int = Query(30, ge=1, le=366, description="Length of the daily series, ending today (UTC)"),
+    top: int = Query(10, ge=1, le=100, description="Number of best-selling products"),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_seller),
+):
+    """Lifetime totals, top products by revenue and a per-day series.
+
+    Reads only the seller's rollup rows (one per sales day and per product
+    sold), never order_items.
+    """
+    totals = (await db.execute(
+        select(
+            func.coalesce(func.sum(SellerDailySales.revenue), 0.0),
+            func.coalesce(func.sum(SellerDailySales.units), 0),
+            func.coalesce(func.sum(SellerDailySales.orders), 0),
+        ).where(SellerDailySales.seller_id == user.id)
+    )).one()
+    best = await db.execute(
+        select(
+            SellerProductSales.product_id,
+            Product.name,
+            SellerProductSales.revenue,
+            SellerProductSales.units,
+            SellerProductSales.orders,
+        )
+        .outerjoin(Product, Product.id == SellerProductSales.product_id)
+        .where(SellerProductSales.seller_id == user.id)
+        .order_by(SellerProductSales.revenue.desc())
+        .limit(top)
+    )
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    sold = {
+        row.day: row
+        for row in await db.execute(
+            select(SellerDailySales.day, SellerDailySales.revenue, SellerDailySales.units, SellerDailySales.orders)
+            .where(SellerDailySales.seller_id == user.id, SellerDailySales.day >= first)
+        )
+    }
+    daily = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        row = sold.get(day)
+        daily.append(SellerDailyStats(
+            day=day,
+            revenue=round(row.revenue, 2) if row else 0.0,
+            units=row.units if row else 0,
+            orders=row.orders if row else 0,
+        ))
+    return SellerStats(
+        revenue=round(totals[0], 2),
+        units=totals[1],
+        orders=totals[2],
+        top_products=[
+            SellerProductStats(**{**row._asdict(), "revenue": round(row.revenue, 2)}) for row in best
+        ],
+        daily=daily,
+    )
+
+
+@router.get("/products/export")
+async def export_products(
+    fmt: Literal["csv", "ndjson"] = Query("ndjson", alias="format"),
+    user: Principal = Depends(require_seller),
+):
+    async def rows():
+        if fmt == "csv":
+            yield csv_line(EXPORT_COLUMNS)
+        # own session: the request's dependencies are torn down before the body streams
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(*(getattr(Product, c) for c in EXPORT_COLUMNS))
+                .where(Product.seller_id == user.id)
+                .order_by(Product.id)
+            )
+            result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for batch in result.partitions():
+                if fmt == "csv":
+                    yield "".join(csv_line(row) for row in batch)
+                else:
+                    yield "".join(ndjson_line(row._asdict()) for row in batch)
+
+    return StreamingResponse(
+        rows(),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="products.{fmt}"'},
+    )
+
+
+@router.post("/products/import", response_model=ProductImportResult)
+async def import_products(
+    request: Request,
+    fmt: Optional[Literal["csv", "ndjson"]] = Query(
+        None,
+        alias="format",
+        description="Defaults from Content-Type (text/csv or application/x-ndjson)",
+    ),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_seller),
 ):
-    return db.query(Product).filter(Product.seller_id == user.id).all()
+    """Stream rows from the request body and insert them in batched transactions.
+
+    Rows with an "id" update that product if it belongs to the seller; rows
+    without one are inserted. Invalid rows are skipped and reported by line.
+    The write lock is only taken per batch, not while the body is read.
+    """
+    fmt = resolve_format(fmt, request.headers.get("content-type"))
+    result = ProductImportResult()
+    touched: List[int] = []
+    inserts: List[dict] = []
+    updates: List[tuple] = []
+
+    def fail(line: int, errors: List[str]):
+        result.failed += 1
+        if len(result.errors) < MAX_REPORTED_IMPORT_ERRORS:
+            result.errors.append(ProductImportError(line=line, errors=errors))
+
+    async def flush():
+        if not inserts and not updates:
+            return
+        now = datetime.utcnow()
+        async with serialized_write():
+            if inserts:
+                await db.execute(insert(_products), inserts)
+                result.inserted += len(inserts)
+            if updates:
+                ids = [pid for _, pid, _ in updates]
+                owned = set((await db.scalars(
+                    select(Product.id).where(Product.id.in_(ids), Product.seller_id == user.id)
+                )).all())
+                # group by column set so each executemany has a uniform parameter shape
+                groups = {}
+                stock = {}  # product id -> its last stock value in this batch
+                for line, pid, values in updates:
+                    if pid not in owned:
+                        fail(line, [f"id: product {pid} not found"])
+                        continue
+                    groups.setdefault(tuple(sorted(values)), []).append(
+                        {**values, "_id": pid, "_seller_id": user.id}
+                    )
+                    touched.append(pid)
+                    if "stock" in values:
+                        stock[pid] = values["stock"]
+                if stock:
+                    # before the updates: the deltas are taken from the levels they replace
+                    await db.execute(record_adjustment, [adjustment(pid, value, now) for pid, value in stock.items()])
+                for params in groups.values():
+                    await db.execute(_update_owned_product, params)
+                    result.updated += len(params)
+            await db.commit()
+        inserts.clear()
+        updates.clear()
+
+    try:
+        async for line, record in iter_records(iter_lines(request.stream()), fmt):
+            if isinstance(record, str):
+                fail(line, [record])
+                continue
+            product_id = record.pop("id", None)
+            try:
+                if product_id is None:
+                    inserts.append({**ProductCreate.model_validate(record).model_dump(), "seller_id": user.id})
+                else:
+                    values = ProductUpdate.model_validate(record).model_dump(exclude_unset=True)
+                    if not values:
+                        fail(line, ["No columns to update"])
+                        continue
+                    updates.append((line, int(product_id), values))
+            except ValidationError as e:
+                fail(line, [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+            except (TypeError, ValueError):  # e.g. "id": [1] or "id": "x"
+                fail(line, ["id: must be an integer"])
+            if len(inserts) + len(updates) >= IMPORT_BATCH_SIZE:
+                await flush()
+        await flush()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Upload must be UTF-8 encoded")
+    finally:
+        if result.inserted or touched:
+            invalidate_products(touched, listings=True)
+    result.errors.sort(key=lambda e: e.line)
+    return result
 
 
 @router.post("/products", response_model=ProductSchema)
 def create_product(
     product: ProductCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(require_seller),
+    db: Session = Depends(get_write_db),
+    user: Principal = Depends(require_seller),
 ):
     p = Product(**product.model_dump(), seller_id=user.id)
     db.add(p)
     db.commit()
     db.refresh(p)
+    invalidate_products([p.id], listings=True)
     return p
 
 
@@ -35,8 +267,8 @@ def create_product(
 def update_product(
     product_id: int,
     product: ProductUpdate,
-    db: Session = Depends(get_db),
-    user: User = Depends(require_seller),
+    db: Session = Depends(get_write_db),
+    user: Principal = Depends(require_seller),
 ):
     p = db.query(Product).filter(
         Product.id == product_id,
@@ -45,18 +277,58 @@ def update_product(
     if not p:
         raise HTTPException(status_code=404, detail="Product not found")
     data = product.model_dump(exclude_unset=True)
+    if "stock" in data:
+        db.execute(record_adjustment, adjustment(p.id, data["stock"]))
     for k, v in data.items():
         setattr(p, k, v)
     db.commit()
     db.refresh(p)
+    invalidate_products([p.id], listings=bool(LISTING_COLUMNS & data.keys()))
     return p
 
 
+@router.put("/products/{product_id}/image", response_model=ProductSchema)
+async def upload_product_image(
+    product_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_seller),
+):
+    """Replace the product's image with the raw request body (JPEG, PNG, GIF or WebP).
+
+    The file and its thumbnail are made in the image worker pool; identical
+    uploads share one stored copy.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Images are limited to {MAX_IMAGE_BYTES // 2**20} MB")
+    if int(request.headers.get("content-length") or 0) > MAX_IMAGE_BYTES:
+        raise too_large
+    owned = await db.scalar(select(Product.id).where(Product.id == product_id, Product.seller_id == user.id))
+    await db.rollback()  # don't hold a read snapshot open while the upload is processed
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > MAX_IMAGE_BYTES:
+            raise too_large
+    image, thumbnail = await store_upload(bytes(data))
+    async with serialized_write():
+        result = await db.execute(
+            _update_owned_product,
+            {"image_url": image, "thumbnail_url": thumbnail, "_id": product_id, "_seller_id": user.id},
+        )
+        await db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Product not found")
+    invalidate_products([product_id])
+    return await db.get(Product, product_id)
+
+
 @router.delete("/products/{product_id}")
 def delete_product(
     product_id: int,
-    db: Session = Depends(get_db),
-    user: User = Depends(require_seller),
+    db: Session = Depends(get_write_db),
+    user: Principal = Depends(require_seller),
 ):
     p = db.query(Product).filter(
         Product.id == product_id,
@@ -66,4 +338,5 @@ def delete_product(
         raise HTTPException(status_code=404, detail="Product not found")
     db.delete(p)
     db.commit()
+    invalidate_products([product_id], listings=True)
     return {"ok": True}
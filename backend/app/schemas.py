@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from typing import Any, Dict, Literal, Optional, List
+from datetime import date, datetime
 
 
 class UserBase(BaseModel):
@@ -74,6 +74,7 @@ class ProductUpdate(BaseModel):
 
 class Product(ProductBase):
     id: int
+    thumbnail_url: Optional[str] = None
     seller_id: Optional[int] = None
     created_at: Optional[datetime] = None
 
@@ -81,10 +82,69 @@ class Product(ProductBase):
         from_attributes = True
 
 
+class ProductImportError(BaseModel):
+    line: int
+    errors: List[str]
+
+
+class ProductImportResult(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ProductImportError] = []
+
+
+class SellerDailyStats(BaseModel):
+    day: date
+    revenue: float
+    units: int
+    orders: int
+
+
+class SellerProductStats(BaseModel):
+    product_id: int
+    name: Optional[str] = None
+    revenue: float
+    units: int
+    orders: int
+
+
+class SellerStats(BaseModel):
+    revenue: float
+    units: int
+    orders: int
+    top_products: List[SellerProductStats]
+    daily: List[SellerDailyStats]
+
+
 class ProductWithCategory(Product):
     category: Optional[Category] = None
 
 
+class CategoryFacet(BaseModel):
+    category_id: Optional[int] = None  # None = uncategorized
+    slug: Optional[str] = None
+    name: Optional[str] = None
+    count: int
+
+
+class PriceFacet(BaseModel):
+    min: float  # inclusive
+    max: float  # exclusive
+    count: int
+
+
+class ProductFacets(BaseModel):
+    total: int
+    categories: List[CategoryFacet]
+    price: List[PriceFacet]
+
+
+class FacetedProducts(BaseModel):
+    items: List[Product]
+    facets: ProductFacets
+
+
 class OrderItemBase(BaseModel):
     product_id: int
     quantity: int
@@ -127,3 +187,71 @@ class Order(BaseModel):
 
 class OrderWithItems(Order):
     items: List[OrderItem] = []
+
+
+OrderStatus = Literal["pending", "shipped", "delivered", "cancelled", "expired"]
+
+
+class OrderStatusUpdate(BaseModel):
+    status: OrderStatus
+
+
+class StockLedgerEntry(BaseModel):
+    id: int
+    order_id: Optional[int] = None
+    delta: int
+    reason: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StockAudit(BaseModel):
+    product_id: int
+    stock: int
+    ledger_balance: int
+    entries: List[StockLedgerEntry] = []
+
+
+class CategorySales(BaseModel):
+    category_id: Optional[int] = None
+    name: Optional[str] = None
+    revenue: float
+    units: int
+    orders: int
+
+
+class SalesBucket(BaseModel):
+    start: datetime
+    revenue: float
+    units: int
+    orders: int
+    average_basket: float
+    categories: List[CategorySales] = []
+
+
+class SalesAnalytics(BaseModel):
+    bucket: str
+    start: datetime
+    end: datetime
+    revenue: float
+    units: int
+    orders: int
+    average_basket: float
+    buckets: List[SalesBucket]
+
+
+class BatchItem(BaseModel):
+    method: Literal["GET"] = "GET"
+    path: str = Field(..., max_length=2048, pattern=r"^/", description="Path and query string, e.g. /products?limit=10")
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
+class BatchResult(BaseModel):
+    status: int
+    headers: Dict[str, str]
+    body: Any
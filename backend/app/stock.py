@@ -0,0 +1,135 @@
+"""Stock reservations, releases and the stock ledger.
+
+products.stock stays the guarded, always-current availability figure that
+checkout decrements; every change to it is also appended to stock_ledger in
+the same transaction, so a product's level can be audited or re-derived as
+the sum of its ledger deltas.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, insert, literal, select, update
+from sqlalchemy.orm import Session, selectinload
+
+from app.models import Order, Product, StockLedger
+from app.rollups import counts_as_sale, order_sale_lines, sales_updates
+
+OPENING = "opening"
+RESERVE = "reserve"
+RELEASE = "release"
+ADJUST = "adjust"
+
+EXPIRED = "expired"
+# pending orders older than this are expired and their stock released (0 = never)
+PENDING_ORDER_TTL = timedelta(minutes=float(os.environ.get("GREENMART_PENDING_ORDER_TTL_MINUTES", "0")))
+EXPIRE_BATCH_SIZE = 500
+
+_products = Product.__table__
+
+# Guarded decrement: matches no row when stock has dropped below the quantity,
+# so concurrent checkouts can't both take the last units.
+take_stock = (
+    update(_products)
+    .where(_products.c.id == bindparam("pid"))
+    .where(_products.c.stock >= bindparam("qty"))
+    .values(stock=_products.c.stock - bindparam("qty"))
+)
+return_stock = (
+    update(_products)
+    .where(_products.c.id == bindparam("pid"))
+    .values(stock=_products.c.stock + bindparam("qty"))
+)
+record_entries = insert(StockLedger.__table__)
+# Ledger entry for setting a product's stock to :stock, with the delta taken
+# from the level at the time it runs; nothing when the level is unchanged. Run
+# it just before the UPDATE that sets the level, in the same transaction: being
+# a write, it holds SQLite's write lock from then on, so a checkout can't
+# change the level in between, as it could after a read earlier in the request.
+record_adjustment = insert(StockLedger.__table__).from_select(
+    ["product_id", "delta", "reason", "created_at"],
+    select(
+        _products.c.id,
+        func.coalesce(bindparam("stock"), 0) - func.coalesce(_products.c.stock, 0),
+        literal(ADJUST),
+        bindparam("now"),
+    ).where(
+        _products.c.id == bindparam("pid"),
+        func.coalesce(_products.c.stock, 0) != func.coalesce(bindparam("stock"), 0),
+    ),
+)
+
+
+def stock_params(quantities: Dict[int, int]) -> List[dict]:
+    return [{"pid": pid, "qty": qty} for pid, qty in quantities.items()]
+
+
+def order_entries(order_id: int, quantities: Dict[int, int], reason: str) -> List[dict]:
+    """Ledger rows for an order reserving (or releasing) these quantities."""
+    now = datetime.utcnow()
+    sign = -1 if reason == RESERVE else 1
+    return [
+        {"product_id": pid, "order_id": order_id, "delta": sign * qty, "reason": reason, "created_at": now}
+        for pid, qty in quantities.items()
+    ]
+
+
+def adjustment(product_id: int, stock: Optional[int], now: Optional[datetime] = None) -> dict:
+    """record_adjustment parameters for a manual edit setting a product's stock."""
+    return {"pid": product_id, "stock": stock, "now": now or datetime.utcnow()}
+
+
+def order_quantities(order: Order) -> Dict[int, int]:
+    quantities: Dict[int, int] = {}
+    for item in order.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def change_order_status(db: Session, order: Order, status: str) -> Set[int]:
+    """Set an order's status, releasing or re-reserving its stock and moving it
+    out of or back into the sales rollups when it stops or starts counting.
+
+    Load the order with its items. Returns the ids of products whose stock
+    changed, for cache invalidation after commit.
+    """
+    was_live, is_live = counts_as_sale(order.status), counts_as_sale(status)
+    order.status = status
+    quantities = order_quantities(order)
+    if was_live == is_live or not quantities:
+        return set()
+    if is_live:
+        updated = db.execute(take_stock, stock_params(quantities))
+        if updated.rowcount != len(quantities):
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Not enough stock left to reinstate this order")
+    else:
+        db.execute(return_stock, stock_params(quantities))
+    db.execute(record_entries, order_entries(order.id, quantities, RESERVE if is_live else RELEASE))
+    for stmt, params in sales_updates(order.created_at, order_sale_lines(order), 1 if is_live else -1):
+        db.execute(stmt, params)
+    return set(quantities)
+
+
+def expire_pending_orders(db: Session, older_than: timedelta = PENDING_ORDER_TTL) -> Set[int]:
+    """Expire pending orders placed before now - older_than, in batches.
+
+    Returns the ids of products whose stock was released.
+    """
+    cutoff = datetime.utcnow() - older_than
+    released: Set[int] = set()
+    while True:
+        orders = (
+            db.query(Order)
+            .options(selectinload(Order.items))
+            .filter(Order.status == "pending", Order.created_at < cutoff)
+            .order_by(Order.created_at)
+            .limit(EXPIRE_BATCH_SIZE)
+            .all()
+        )
+        for order in orders:
+            released |= change_order_status(db, order, EXPIRED)
+        db.commit()
+        if len(orders) < EXPIRE_BATCH_SIZE:
+            return released
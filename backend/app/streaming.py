@@ -0,0 +1,98 @@
+import codecs
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def resolve_format(fmt: Optional[str], content_type: Optional[str] = None) -> str:
+    """Pick csv/ndjson from an explicit format parameter or a Content-Type header."""
+    if fmt is None and content_type:
+        media_type = content_type.split(";")[0].strip().lower()
+        fmt = next((f for f, mt in FORMATS.items() if mt == media_type), None)
+        if fmt is None and media_type in ("application/ndjson", "application/jsonl"):
+            fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'ndjson'")
+    return fmt
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream as UTF-8 and yield it line by line, keeping line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        # the last piece may be a partial line; keep it for the next chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (line number, record) pairs; a record is a dict, or an error string if unparseable."""
+    if fmt == "csv":
+        async for item in _iter_csv(lines):
+            yield item
+        return
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"Invalid JSON: {e}"
+            continue
+        yield line_no, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+async def _iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    header: Optional[List[str]] = None
+    record, start, line_no = "", 0, 0
+    async for line in lines:
+        line_no += 1
+        if not record:
+            start = line_no
+        record += line
+        # a quoted field may span lines; the record is complete once quotes balance
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # empty cells mean "not provided" so schema defaults apply
+        yield start, {k: v for k, v in zip(header, values) if v != ""}
+    if record.strip():
+        yield start, "Unterminated quoted field"
+
+
+def csv_line(values: Iterable[Any]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(
+        "" if v is None else v for v in jsonable_encoder(list(values))
+    )
+    return buf.getvalue()
+
+
+def ndjson_line(record: Dict[str, Any]) -> str:
+    return json.dumps(jsonable_encoder(record)) + "\n"
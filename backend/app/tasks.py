@@ -0,0 +1,87 @@
+"""Background work triggered by orders, and periodic housekeeping.
+
+There is no mail transport configured, so notifications are written to the
+"greenmart.email" logger; route that logger to a mail handler to deliver them.
+"""
+import logging
+import os
+from typing import Dict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from app.cache import invalidate_products
+from app.coherence import purge_invalidations
+from app.database import AsyncSessionLocal
+from app.idempotency import purge_expired
+from app.jobs import enqueue, job_handler, periodic
+from app.models import Order, Product, User
+from app.stock import PENDING_ORDER_TTL, expire_pending_orders
+
+email_logger = logging.getLogger("greenmart.email")
+
+LOW_STOCK_THRESHOLD = int(os.environ.get("GREENMART_LOW_STOCK_THRESHOLD", "5"))
+
+ORDER_CONFIRMATION = "order.confirmation"
+LOW_STOCK_ALERT = "stock.low_alert"
+
+
+def enqueue_order_followups(db, order_id: int, stock_before: Dict[int, int], quantities: Dict[int, int]) -> None:
+    """Queue the confirmation email, plus a low-stock alert for products this order took below the threshold."""
+    enqueue(db, ORDER_CONFIRMATION, {"order_id": order_id})
+    crossed = [
+        pid for pid, qty in quantities.items()
+        if stock_before[pid] > LOW_STOCK_THRESHOLD >= stock_before[pid] - qty
+    ]
+    if crossed:
+        enqueue(db, LOW_STOCK_ALERT, {"product_ids": crossed})
+
+
+@job_handler(ORDER_CONFIRMATION)
+async def send_order_confirmation(payload: dict) -> None:
+    async with AsyncSessionLocal() as db:
+        order = (await db.execute(
+            select(Order).options(selectinload(Order.items)).where(Order.id == payload["order_id"])
+        )).scalar_one_or_none()
+    if order is None:
+        return
+    email_logger.info(
+        "to=%s subject=%r items=%d total=%.2f",
+        order.email,
+        f"Greenmart order #{order.id} confirmed",
+        sum(item.quantity for item in order.items),
+        order.total,
+    )
+
+
+@job_handler(LOW_STOCK_ALERT)
+async def alert_low_stock(payload: dict) -> None:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Product.id, Product.name, Product.stock, User.email)
+            .join(User, User.id == Product.seller_id)
+            .where(Product.id.in_(payload["product_ids"]), Product.stock <= LOW_STOCK_THRESHOLD)
+        )).all()
+    # re-checked at run time: a restock since the order means there is nothing to report
+    for row in rows:
+        email_logger.info(
+            "to=%s subject=%r product_id=%d stock=%d",
+            row.email, f"Low stock: {row.name}", row.id, row.stock,
+        )
+
+
+@periodic(3600)
+def purge_idempotency_keys(db: Session) -> None:
+    purge_expired(db)
+
+
+@periodic(600)
+def purge_cache_invalidations(db: Session) -> None:
+    purge_invalidations(db)
+
+
+@periodic(60)
+def expire_stale_orders(db: Session) -> None:
+    if PENDING_ORDER_TTL:
+        released = expire_pending_orders(db)
+        invalidate_products(released, listings=bool(released))
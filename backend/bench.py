@@ -0,0 +1,166 @@
+"""In-process endpoint benchmark.
+
+Drives the app through httpx's ASGI transport (no network, no server) and
+reports throughput and latency percentiles per endpoint. Point it at a
+scaled database to reproduce production volumes:
+
+    GREENMART_DB_PATH=bench.db python seed.py --scale --products 100000 --orders 1000000
+    GREENMART_DB_PATH=bench.db python bench.py --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from sqlalchemy import select
+
+from app import admission, pagination
+from app.auth import hash_pool
+from app.cache import catalog_cache
+from app.database import SessionLocal, init_db
+from app.main import app
+from app.models import Category, Product
+
+BENCH_EMAIL = "bench-seller@example.com"
+BENCH_PASSWORD = "bench-password"
+SEARCH_TERMS = ["product", "rose", "plant", "seed", "synthetic", "flower"]
+
+
+def _catalog_sample(size=1000):
+    db = SessionLocal()
+    try:
+        slugs = db.execute(select(Category.slug)).scalars().all()
+        product_ids = db.execute(
+            select(Product.id).where(Product.stock > 0).order_by(Product.stock.desc()).limit(size)
+        ).scalars().all()
+    finally:
+        db.close()
+    return slugs, product_ids
+
+
+async def _token(client):
+    r = await client.post("/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    if r.status_code == 401:
+        r = await client.post("/auth/signup", json={
+            "email": BENCH_EMAIL, "password": BENCH_PASSWORD,
+            "full_name": "Bench Seller", "role": "seller",
+        })
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+def scenarios(slugs, product_ids, token):
+    """name -> factory returning (method, url, kwargs) for one request."""
+    auth = {"headers": {"Authorization": f"Bearer {token}"}}
+    order = lambda: {"json": {
+        "customer_name": "Bench", "email": "bench@example.com", "address": "1 Bench Road",
+        "items": [{"product_id": random.choice(product_ids), "quantity": 1, "price": 0}],
+    }}
+    return {
+        "GET /categories": lambda: ("GET", "/categories", {}),
+        "GET /products": lambda: ("GET", "/products?limit=100", {}),
+        "GET /products?category": lambda: ("GET", f"/products?category={random.choice(slugs)}&limit=100", {}),
+        "GET /products/{id}": lambda: ("GET", f"/products/{random.choice(product_ids)}", {}),
+        "GET /products/search": lambda: ("GET", f"/products/search?q={random.choice(SEARCH_TERMS)}&limit=50", {}),
+        "POST /orders": lambda: ("POST", "/orders", order()),
+        "POST /auth/login": lambda: ("POST", "/auth/login", {"json": {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}}),
+        "GET /auth/me": lambda: ("GET", "/auth/me", auth),
+        "GET /seller/products": lambda: ("GET", "/seller/products?limit=100", auth),
+        "GET /admin/orders": lambda: ("GET", "/admin/orders?limit=100", {}),
+        "GET /admin/products": lambda: ("GET", "/admin/products?limit=100", {}),
+    }
+
+
+async def run_scenario(client, make_request, requests, concurrency):
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, kwargs = make_request()
+            t0 = time.perf_counter()
+            r = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def summarize(name, latencies, errors, elapsed):
+    ms = sorted(l * 1000 for l in latencies)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {
+        "endpoint": name,
+        "requests": len(ms),
+        "errors": errors,
+        "rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+    }
+
+
+def print_table(rows):
+    cols = ["endpoint", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+async def main(args):
+    init_db()
+    admission.RATE_LIMITING = False  # every simulated client shares one address
+    if args.no_cache:
+        catalog_cache.disable()
+    if args.fast_json:
+        pagination.FAST_JSON = True
+    slugs, product_ids = _catalog_sample()
+    if not product_ids or not slugs:
+        sys.exit("Database has no stocked products or categories; run seed.py first.")
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            token = await _token(client)
+            for name, make_request in scenarios(slugs, product_ids, token).items():
+                if args.only and not any(o in name for o in args.only):
+                    continue
+                requests = args.requests
+                if name == "POST /auth/login":
+                    requests = min(requests, args.login_requests)
+                # warm connections, pools and caches so they don't skew the first samples
+                await run_scenario(client, make_request, min(requests, args.concurrency), args.concurrency)
+                latencies, errors, elapsed = await run_scenario(client, make_request, requests, args.concurrency)
+                results.append(summarize(name, latencies, errors, elapsed))
+                print(f"{name}: {results[-1]['rps']} req/s", file=sys.stderr)
+    finally:
+        hash_pool.shutdown()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--login-requests", type=int, default=50, help="cap for bcrypt-bound login")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="*", help="substring filter on endpoint names")
+    parser.add_argument("--no-cache", action="store_true", help="disable the catalog response cache")
+    parser.add_argument("--fast-json", action="store_true", help="serve list pages as orjson-encoded row tuples")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,37 @@
+"""Recompute the sales rollup tables from order history.
+
+create_order keeps the rollups current; run this after loading orders
+outside the API, or to repair a rollup. Each rollup is rebuilt in one write
+transaction, so API writes wait for it to finish:
+
+    python rebuild_rollups.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, init_db
+from app.rollups import REBUILDS
+
+
+def rebuild(names=None):
+    for name in names or REBUILDS:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            rows = REBUILDS[name](conn)
+        print(f"{name}: {rows} rows in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="*", choices=sorted(REBUILDS), help="rollups to rebuild (default: all)")
+    args = parser.parse_args()
+    init_db()
+    rebuild(args.only)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
+import argparse
 import os
+import random
 import sys
+import time
+from datetime import datetime, timedelta
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from sqlalchemy import func, insert, select
+
+from app.auth import get_password_hash
 from app.database import engine, SessionLocal, init_db
-from app.models import Base, Category, Product
+from app.models import Base, Category, Product, User, Order, OrderItem
+from app.rollups import REBUILDS
 
 def seed():
     init_db()
@@ -108,5 +116,169 @@ def seed():
     db.close()
     print("Seed completed. Products and categories added.")
 
+def _insert_batches(conn, table, rows, batch_size):
+    """executemany rows (any iterable) in chunks, committing after each chunk."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.execute(insert(table), batch)
+            conn.commit()
+            batch.clear()
+    if batch:
+        conn.execute(insert(table), batch)
+        conn.commit()
+
+
+def seed_scale(
+    categories=20,
+    sellers=10_000,
+    products=100_000,
+    orders=1_000_000,
+    max_items=5,
+    days=365,
+    batch_size=10_000,
+    random_seed=42,
+):
+    """Append a synthetic catalog and order history of the given size.
+
+    Every seller's password is "password". Rows are generated lazily and
+    bulk-inserted with executemany, so memory stays flat at any volume.
+    """
+    init_db()
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    def log(msg):
+        print(f"[{time.perf_counter() - started:7.1f}s] {msg}")
+
+    with engine.connect() as conn:
+        def next_id(model):
+            return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+        first_category = next_id(Category)
+        _insert_batches(conn, Category.__table__, (
+            {"name": f"Category {first_category + i}", "slug": f"category-{first_category + i}"}
+            for i in range(categories)
+        ), batch_size)
+        category_ids = range(first_category, first_category + categories)
+        log(f"{categories} categories")
+
+        first_seller = next_id(User)
+        password_hash = get_password_hash("password")  # bcrypt once, not per seller
+        _insert_batches(conn, User.__table__, (
+            {
+                "email": f"seller{first_seller + i}@example.com",
+                "hashed_password": password_hash,
+                "full_name": f"Seller {first_seller + i}",
+                "role": "seller",
+                "is_active": True,
+                "created_at": now - timedelta(days=rng.uniform(0, days)),
+            }
+            for i in range(sellers)
+        ), batch_size)
+        seller_ids = range(first_seller, first_seller + sellers)
+        log(f"{sellers} sellers")
+
+        first_product = next_id(Product)
+        prices = {}
+        sale_keys = {}  # product id -> its seller and category, copied onto order items
+
+        def product_rows():
+            for i in range(products):
+                pid = first_product + i
+                prices[pid] = round(rng.uniform(1, 150), 2)
+                sale_keys[pid] = {
+                    "category_id": rng.choice(category_ids) if categories else None,
+                    "seller_id": rng.choice(seller_ids) if sellers else None,
+                }
+                yield {
+                    "name": f"Product {pid}",
+                    "description": f"Synthetic product {pid} for load testing.",
+                    "price": prices[pid],
+                    "image_url": f"https://picsum.photos/seed/{pid}/400/400",
+                    **sale_keys[pid],
+                    "stock": rng.randint(0, 1000),
+                    "created_at": now - timedelta(days=rng.uniform(0, days)),
+                }
+
+        _insert_batches(conn, Product.__table__, product_rows(), batch_size)
+        product_ids = list(prices)
+        log(f"{products} products")
+
+        if not product_ids:
+            return
+        first_order = next_id(Order)
+        first_item = next_id(OrderItem)
+        item_rows = []
+
+        def order_rows():
+            item_id = first_item
+            for i in range(orders):
+                oid = first_order + i
+                total = 0.0
+                for pid in rng.sample(product_ids, min(len(product_ids), rng.randint(1, max_items))):
+                    quantity = rng.randint(1, 3)
+                    total += prices[pid] * quantity
+                    item_rows.append({
+                        "id": item_id, "order_id": oid, "product_id": pid,
+                        "quantity": quantity, "price": prices[pid], **sale_keys[pid],
+                    })
+                    item_id += 1
+                yield {
+                    "id": oid,
+                    "customer_name": f"Customer {oid}",
+                    "email": f"customer{rng.randint(1, max(1, orders // 4))}@example.com",
+                    "address": f"{oid} Green Street",
+                    "total": round(total, 2),
+                    "status": rng.choice(("pending", "pending", "shipped", "delivered")),
+                    "created_at": now - timedelta(days=rng.uniform(0, days)),
+                }
+                # flush items alongside their orders to keep the buffer bounded
+                if len(item_rows) >= batch_size:
+                    conn.execute(insert(OrderItem.__table__), item_rows)
+                    item_rows.clear()
+
+        _insert_batches(conn, Order.__table__, order_rows(), batch_size)
+        if item_rows:
+            conn.execute(insert(OrderItem.__table__), item_rows)
+            conn.commit()
+        log(f"{orders} orders")
+
+    # orders were inserted behind create_order's back, so its rollups are stale
+    for name, rebuild in REBUILDS.items():
+        with engine.begin() as conn:
+            rebuild(conn)
+        log(f"{name} rollup rebuilt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the Greenmart database.")
+    parser.add_argument("--scale", action="store_true", help="generate synthetic data at volume")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--sellers", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--max-items", type=int, default=5, help="max line items per order")
+    parser.add_argument("--days", type=int, default=365, help="spread created_at over this many days")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+    if not args.scale:
+        seed()
+        return
+    seed_scale(
+        categories=args.categories,
+        sellers=args.sellers,
+        products=args.products,
+        orders=args.orders,
+        max_items=args.max_items,
+        days=args.days,
+        batch_size=args.batch_size,
+        random_seed=args.random_seed,
+    )
+
+
 if __name__ == "__main__":
-    seed()
+    main()
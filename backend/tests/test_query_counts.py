@@ -0,0 +1,103 @@
+"""Statement counts for endpoints that embed related rows, so an N+1 can't creep back in."""
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+_tmp = tempfile.mkdtemp(prefix="greenmart-test-")
+os.environ["GREENMART_DB_PATH"] = os.path.join(_tmp, "greenmart.db")
+os.environ["GREENMART_IMAGE_DIR"] = os.path.join(_tmp, "images")
+os.environ["GREENMART_RATE_LIMIT"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.cache import catalog_cache
+from app.database import SessionLocal, async_engine, async_read_engine, engine, read_engine
+from app.main import app
+from app.models import Category, Order, OrderItem, Product
+
+PAGE_SIZES = (5, 20)
+LARGE_ORDER_ITEMS = 10
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        db = SessionLocal()
+        categories = [Category(name=f"Category {i}", slug=f"category-{i}") for i in range(3)]
+        db.add_all(categories)
+        db.flush()
+        products = [
+            Product(name=f"Plant {i}", price=10 + i, stock=5, category_id=categories[i % 3].id)
+            for i in range(30)
+        ]
+        db.add_all(products)
+        db.flush()
+        # order 1, for the detail endpoints: enough items that a per-item query would show
+        large = Order(customer_name="Bulk Buyer", email="bulk@example.com", address="1 Leaf Lane", total=0)
+        large.items = [OrderItem(product_id=p.id, quantity=1, price=p.price) for p in products[:LARGE_ORDER_ITEMS]]
+        db.add(large)
+        for i in range(30):
+            order = Order(customer_name=f"Buyer {i}", email=f"b{i}@example.com", address="1 Leaf Lane", total=0)
+            order.items = [OrderItem(product_id=p.id, quantity=1, price=p.price) for p in products[i:i + 2]]
+            db.add(order)
+        db.commit()
+        db.close()
+        yield c
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine, read_engine, async_read_engine.sync_engine)
+    for e in engines:
+        event.listen(e, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", before_cursor_execute)
+
+
+def get(client, url):
+    catalog_cache.clear()  # measure the queries, not a cached response
+    with count_statements() as statements:
+        response = client.get(url)
+    assert response.status_code == 200, response.text
+    return response.json(), len(statements)
+
+
+@pytest.mark.parametrize("url, key, max_statements", [
+    ("/products?include=category&limit={}", "category", 2),
+    ("/admin/orders?include=items&limit={}", "items", 2),
+])
+def test_list_statements_do_not_grow_with_page_size(client, url, key, max_statements):
+    counts = []
+    for limit in PAGE_SIZES:
+        rows, count = get(client, url.format(limit))
+        assert len(rows) == limit
+        assert all(row[key] for row in rows)
+        counts.append(count)
+    assert counts[0] == counts[1] <= max_statements
+
+
+@pytest.mark.parametrize("url, key, max_statements", [
+    ("/products/1?include=category", "category", 1),
+    ("/orders/1", "items", 2),
+    ("/admin/orders/1", "items", 2),
+])
+def test_detail_statements_are_bounded(client, url, key, max_statements):
+    row, count = get(client, url)
+    assert row[key]
+    if key == "items":
+        assert len(row["items"]) == LARGE_ORDER_ITEMS
+    assert count <= max_statements
@@ -2,6 +2,7 @@
 
 import { useEffect, useState } from "react";
 import Link from "next/link";
+import { fetchAllPages } from "@/lib/api";
 
 interface Product {
   id: number;
@@ -27,8 +28,8 @@ export default function AdminPage() {
 
   useEffect(() => {
     Promise.all([
-      fetch(`${API}/admin/products`).then((r) => r.json()),
-      fetch(`${API}/admin/orders`).then((r) => r.json()),
+      fetchAllPages<Product>(`${API}/admin/products`),
+      fetchAllPages<Order>(`${API}/admin/orders`),
     ])
       .then(([p, o]) => {
         setProducts(p);
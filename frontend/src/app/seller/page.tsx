@@ -4,6 +4,7 @@ import { useEffect, useState } from "react";
 import Link from "next/link";
 import { useRouter } from "next/navigation";
 import { useAuth } from "@/contexts/AuthContext";
+import { fetchAllPages } from "@/lib/api";
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
@@ -51,7 +52,7 @@ export default function SellerPage() {
   useEffect(() => {
     if (!user || user.role !== "seller") return;
     Promise.all([
-      fetchWithAuth(`${API_URL}/seller/products`).then((r) => (r.ok ? r.json() : [])),
+      fetchAllPages<Product>(`${API_URL}/seller/products`, fetchWithAuth).catch(() => []),
       fetch(`${API_URL}/categories`).then((r) => (r.ok ? r.json() : [])),
     ])
       .then(([p, c]) => {
@@ -38,13 +38,34 @@ export interface Order {
   status: string;
 }
 
+// List endpoints return one page at a time and point at the next one with this header.
+const NEXT_CURSOR_HEADER = "X-Next-Cursor";
+const PAGE_LIMIT = 500;
+
+export async function fetchAllPages<T>(
+  url: string,
+  doFetch: (url: string) => Promise<Response> = fetch,
+): Promise<T[]> {
+  const items: T[] = [];
+  const page = new URL(url);
+  page.searchParams.set("limit", String(PAGE_LIMIT));
+  for (;;) {
+    const res = await doFetch(page.toString());
+    if (!res.ok) throw new Error(`Failed to fetch ${url}`);
+    items.push(...(await res.json()));
+    const cursor = res.headers.get(NEXT_CURSOR_HEADER);
+    if (!cursor) return items;
+    page.searchParams.set("cursor", cursor);
+  }
+}
+
 export async function getProducts(category?: string): Promise<Product[]> {
   const url = category
     ? `${API_URL}/products?category=${encodeURIComponent(category)}`
     : `${API_URL}/products`;
-  const res = await fetch(url);
-  if (!res.ok) throw new Error("Failed to fetch products");
-  return res.json();
+  return fetchAllPages<Product>(url).catch(() => {
+    throw new Error("Failed to fetch products");
+  });
 }
 
 export async function getProduct(id: number): Promise<Product> {